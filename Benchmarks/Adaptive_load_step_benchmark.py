@@ -0,0 +1,55 @@
+# This code is generated by Dr. Manish Kumar with the collaboration of Dr. Enrico Salvati and Dr. Roberto Alessi.
+# Contact email: Manish Kumar <mkumar2@me.iitr.ac.in>, Enrico Salvati <enrico.salvati@uniud.it>, Group website https://simed.uniud.it/
+# This code compares the adaptive load step controller with the fixed load steps for the three specimens of src. Each
+# specimen script is run with both options, and the peak load, the displacement at the peak and the post-peak force
+# displacement curve of the adaptive run are compared with the fixed-step run, together with the load steps and wall time.
+# Copyright (C) <2023>  <Manish Kumar>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# All the required libraries are imported into the code
+import numpy as np
+import os
+from Specimen_runner import specimens, run_specimen
+
+# Benchmark data
+tolerance = 0.02                      # admissible error of the peak load and of the post-peak curve, relative to the peak load
+work_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'adaptive_load_step_benchmark')
+
+def curve_error(forces, forces_ref):
+    """Peak load, displacement at the peak and maximum post-peak force difference, relative to the peak load of forces_ref"""
+    (disp, force), (disp_ref, force_ref) = np.abs(forces[:, :2]).T, np.abs(forces_ref[:, :2]).T
+    i_peak, i_peak_ref = np.argmax(force), np.argmax(force_ref)
+    peak_error = abs(force[i_peak] - force_ref[i_peak_ref])/force_ref[i_peak_ref]
+    post_peak = (disp_ref >= disp_ref[i_peak_ref]) & (disp_ref <= disp.max())       # post-peak points of the reference covered by both runs
+    order = np.argsort(disp)
+    curve = np.max(np.abs(np.interp(disp_ref[post_peak], disp[order], force[order]) - force_ref[post_peak]))/force_ref[i_peak_ref]
+    return (force[i_peak], disp[i_peak], peak_error, curve)
+
+results = []
+for (script, mesh_file) in specimens:
+    runs = {}
+    for load_control in ['fixed', 'adaptive']:
+        name = "%s_%s" %(os.path.splitext(script)[0], load_control)
+        runs[load_control] = run_specimen(script, mesh_file, {'load_control': load_control}, work_dir, name)
+    for load_control in ['fixed', 'adaptive']:
+        (wall_time, forces) = runs[load_control]
+        (peak, disp_peak, peak_error, curve) = curve_error(forces, runs['fixed'][1])
+        results.append((script, load_control, len(forces) - 1, wall_time, peak, disp_peak, peak_error, curve, 'yes' if max(peak_error, curve) <= tolerance else 'no'))
+        print("%-26s %-9s steps %5d, wall time %9.1f sec, peak load %.6g at %.6g, peak error %.2e, post-peak error %.2e, within tolerance: %s" %results[-1])
+
+# Summary of the benchmark
+print("\n%-26s %-9s %6s %14s %12s %12s %10s %10s %4s" %('specimen', 'control', 'steps', 'wall time [s]', 'peak load', 'at disp.', 'peak err', 'curve err', 'ok'))
+for result in results:
+    print("%-26s %-9s %6d %14.1f %12.6g %12.6g %10.2e %10.2e %4s" %result)
@@ -0,0 +1,43 @@
+# This code is generated by Dr. Manish Kumar with the collaboration of Dr. Enrico Salvati and Dr. Roberto Alessi.
+# Contact email: Manish Kumar <mkumar2@me.iitr.ac.in>, Enrico Salvati <enrico.salvati@uniud.it>, Group website https://simed.uniud.it/
+# This code measures the gain of the reuse of the symbolic analysis of the MUMPS factorisation of the displacement solver.
+# Each specimen script of src is run with and without reuse, and the wall time and the peak load of the two runs are
+# compared. The counts of the factorisations measured by the PETSc log are printed by each run.
+# Copyright (C) <2023>  <Manish Kumar>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# All the required libraries are imported into the code
+import numpy as np
+import os
+from Specimen_runner import specimens, run_specimen
+
+# Benchmark data
+work_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'factorization_reuse_benchmark')
+
+results = []
+for (script, mesh_file) in specimens:
+    runs = {}
+    for reuse in [False, True]:
+        name = "%s_reuse_%s" %(os.path.splitext(script)[0], reuse)
+        runs[reuse] = run_specimen(script, mesh_file, {'u_reuse_factorization': reuse}, work_dir, name)
+    (time_ref, forces_ref), (wall_time, forces) = runs[False], runs[True]
+    peak_ref, peak = np.max(np.abs(forces_ref[:, 1])), np.max(np.abs(forces[:, 1]))
+    results.append((script, time_ref, wall_time, time_ref/wall_time, abs(peak - peak_ref)/peak_ref))
+    print("%-26s without reuse %9.1f sec, with reuse %9.1f sec, speed-up %.3g, peak load difference %.2e" %results[-1])
+
+# Summary of the benchmark
+print("\n%-26s %16s %16s %9s %10s" %('specimen', 'no reuse [s]', 'reuse [s]', 'speed-up', 'peak diff'))
+for result in results:
+    print("%-26s %16.1f %16.1f %9.3g %10.2e" %result)
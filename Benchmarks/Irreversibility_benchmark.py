@@ -0,0 +1,45 @@
+# This code is generated by Dr. Manish Kumar with the collaboration of Dr. Enrico Salvati and Dr. Roberto Alessi.
+# Contact email: Manish Kumar <mkumar2@me.iitr.ac.in>, Enrico Salvati <enrico.salvati@uniud.it>, Group website https://simed.uniud.it/
+# This code compares the enforcement of the irreversibility for the three specimens of src: the bound constraints of the
+# TAO solver, the penalty term and the augmented Lagrangian, both solved by Newton. Each specimen script is run with each
+# option and the wall time and the peak load are compared with the bound-constrained run.
+# Copyright (C) <2023>  <Manish Kumar>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# All the required libraries are imported into the code
+import numpy as np
+import os
+from Specimen_runner import specimens, run_specimen
+
+# Benchmark data
+options = ['bounds', 'penalty', 'augmented_lagrangian']      # compared enforcements of the irreversibility, 'bounds' as reference
+work_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'irreversibility_benchmark')
+
+results = []
+for (script, mesh_file) in specimens:
+    peak_ref = None
+    for option in options:
+        name = "%s_%s" %(os.path.splitext(script)[0], option)
+        (wall_time, forces) = run_specimen(script, mesh_file, {'irreversibility': option}, work_dir, name)
+        peak = np.max(np.abs(forces[:, 1]))
+        if peak_ref is None:
+            peak_ref = peak                                            # bound-constrained run as reference
+        results.append((script, option, wall_time, peak, abs(peak - peak_ref)/peak_ref))
+        print("%-26s %-22s wall time %9.1f sec, peak load %.6g, error %.2e" %results[-1])
+
+# Summary of the benchmark
+print("\n%-26s %-22s %14s %12s %10s" %('specimen', 'irreversibility', 'wall time [s]', 'peak load', 'error'))
+for result in results:
+    print("%-26s %-22s %14.1f %12.6g %10.2e" %result)
@@ -0,0 +1,155 @@
+# This code is generated by Dr. Manish Kumar with the collaboration of Dr. Enrico Salvati and Dr. Roberto Alessi.
+# Contact email: Manish Kumar <mkumar2@me.iitr.ac.in>, Enrico Salvati <enrico.salvati@uniud.it>, Group website https://simed.uniud.it/
+# This code compares the MUMPS factorisation with the Krylov solvers (CG, GMRES) preconditioned by algebraic multigrid
+# (GAMG, BoomerAMG) for the displacement field of the 3-point bend and L-shaped specimens. The stiffness is degraded with the
+# a(alpha) of the scripts along the expected crack path, down to the residual stiffness k_ell, and the meshes of Input_data are uniformly refined.
+# Copyright (C) <2023>  <Manish Kumar>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# All the required libraries are imported into the code
+from fenics import *               # FEniCS library
+import numpy as np
+import os, time
+
+parameters["form_compiler"]["cpp_optimize"] = True
+
+# Benchmark data
+solvers = ['mumps', 'cg_gamg', 'cg_hypre', 'gmres_gamg', 'gmres_hypre']      # compared configurations of the linear solver
+num_refinements = 2                   # number of uniform refinements of the meshes
+tol = 1E-5
+input_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Input_data')
+
+# Boundary conditions of the 3-point bend specimen (same as src/3_point_bend_specimen.py)
+def bc_3_pt_bend(V):
+    return [DirichletBC(V, Constant((0.0, 0.0)), lambda x, on_boundary: x[0] >= 49.0 - tol and x[0] <= 51.0 - tol and x[1] <= 0.0 + tol, method='pointwise'),
+            DirichletBC(V.sub(1), Constant(0.0), lambda x, on_boundary: x[0] >= 399.0 - tol and x[0] <= 401.0 - tol and x[1] <= 0.0 + tol, method='pointwise'),
+            DirichletBC(V.sub(1), Constant(-0.01), lambda x, on_boundary: x[1] >= 103.0-tol and x[0] >= 224.9-tol and x[0] <= 225.1+tol, method='pointwise')]
+
+# Boundary conditions of the L-shaped specimen (same as src/L_shaped_specimen.py)
+def bc_L_shape(V):
+    return [DirichletBC(V.sub(1), Constant(0.0), lambda x, on_boundary: x[1] <= 0.0 + tol, method='pointwise'),
+            DirichletBC(V, Constant((0.0, 0.0)), lambda x, on_boundary: x[0] >= 250.0 - tol and x[1] <= 0.0 + tol, method='pointwise'),
+            DirichletBC(V.sub(1), Constant(0.01), lambda x, on_boundary: x[1] <= 250.0+tol and x[0] >= 469.9-tol and x[0] <= 470.1 +tol, method='pointwise')]
+
+def a(alpha, a_1):
+    """Stiffness modulation of the specimen scripts (Cornelissen softening), a_1 depends on the specimen"""
+    k_ell = Constant(1.e-6)                                        #  residual stiffness
+    a_2 = 1.3868
+    a_3 = 0.6567
+    Q_d = a_1*alpha + a_1*a_2*alpha**2 + a_1*a_2*a_3*alpha**3
+    return ((1-alpha)**2)/((1-alpha)**2 + Q_d) +k_ell
+
+# mesh file, Young's modulus, Poisson ratio, characteristic length, a_1 of a(alpha), crack path and boundary conditions
+specimens = [('3_pt_bend.xml', 20000., 0.2, 1.5, Constant(1046.3/pi), ((225., 0.), (225., 60.)), bc_3_pt_bend),
+             ('L_shape_coarse.xml', 25850., 0.18, 5., Constant(255.3/pi), ((250., 250.), (150., 230.)), bc_L_shape)]
+
+def crack_band(V, p_0, p_1, ell):
+    """Phase field decaying exponentially with the distance from the crack path p_0-p_1"""
+    x = V.tabulate_dof_coordinates().reshape((-1, 2))
+    p_0, p_1 = np.array(p_0), np.array(p_1)
+    s = np.clip(np.dot(x - p_0, p_1 - p_0)/np.dot(p_1 - p_0, p_1 - p_0), 0., 1.)
+    d = np.linalg.norm(x - (p_0 + np.outer(s, p_1 - p_0)), axis=1)
+    alpha = Function(V)
+    alpha.vector().set_local(np.exp(-d/ell))
+    alpha.vector().apply('insert')
+    return alpha
+
+def build_nullspace(V, x):
+    """Rigid body modes of the displacement field, used as near-nullspace by the multigrid preconditioners"""
+    gdim = V.mesh().geometry().dim()
+    nullspace_basis = [x.copy() for i in range(3 if gdim == 2 else 6)]
+    for i in range(gdim):
+        V.sub(i).dofmap().set(nullspace_basis[i], 1.0)            # translations
+    V.sub(0).set_x(nullspace_basis[gdim], -1.0, 1)                # rotation in the x-y plane
+    V.sub(1).set_x(nullspace_basis[gdim], 1.0, 0)
+    if gdim == 3:
+        V.sub(0).set_x(nullspace_basis[4], 1.0, 2)                # rotation in the x-z plane
+        V.sub(2).set_x(nullspace_basis[4], -1.0, 0)
+        V.sub(2).set_x(nullspace_basis[5], 1.0, 1)                # rotation in the y-z plane
+        V.sub(1).set_x(nullspace_basis[5], -1.0, 2)
+    for x in nullspace_basis:
+        x.apply("insert")
+    basis = VectorSpaceBasis(nullspace_basis)
+    basis.orthonormalize()
+    return basis
+
+def set_solver_options(prefix, solver):
+    """PETSc options of the linear solver, same defaults as solver_u of the specimen scripts"""
+    if solver == 'mumps':
+        PETScOptions.set(prefix+"ksp_type", "preonly")
+        PETScOptions.set(prefix+"pc_type", "lu")
+        PETScOptions.set(prefix+"pc_factor_mat_solver_type", "mumps")
+        return
+    ksp_type, pc_type = solver.split('_')
+    PETScOptions.set(prefix+"ksp_type", ksp_type)
+    PETScOptions.set(prefix+"ksp_rtol", 1.e-8)
+    PETScOptions.set(prefix+"ksp_atol", 1.e-12)
+    PETScOptions.set(prefix+"ksp_max_it", 2000)
+    PETScOptions.set(prefix+"ksp_gmres_restart", 100)
+    PETScOptions.set(prefix+"pc_type", pc_type)
+    if pc_type == 'gamg':
+        PETScOptions.set(prefix+"pc_gamg_type", "agg")
+        PETScOptions.set(prefix+"pc_gamg_agg_nsmooths", 1)
+        PETScOptions.set(prefix+"pc_gamg_threshold", 0.02)
+        PETScOptions.set(prefix+"mg_levels_ksp_type", "chebyshev")
+        PETScOptions.set(prefix+"mg_levels_pc_type", "jacobi")
+        PETScOptions.set(prefix+"mg_levels_esteig_ksp_type", "cg")
+    else:
+        PETScOptions.set(prefix+"pc_hypre_type", "boomeramg")
+        PETScOptions.set(prefix+"pc_hypre_boomeramg_strong_threshold", 0.5)
+        PETScOptions.set(prefix+"pc_hypre_boomeramg_coarsen_type", "HMIS")
+        PETScOptions.set(prefix+"pc_hypre_boomeramg_interp_type", "ext+i")
+        PETScOptions.set(prefix+"pc_hypre_boomeramg_agg_nl", 2)
+        PETScOptions.set(prefix+"pc_hypre_boomeramg_nodal_coarsen", 6)
+        PETScOptions.set(prefix+"pc_hypre_boomeramg_vec_interp_variant", 3)
+
+for solver in solvers:
+    set_solver_options(solver+"_", solver)
+
+results = []
+for (mesh_file, E, nu, ell, a_1, crack, boundary_conditions) in specimens:
+    mesh = Mesh(os.path.join(input_dir, mesh_file))
+    for level in range(num_refinements+1):
+        if level > 0:
+            mesh = refine(mesh)
+        mu, lmbda = E/(2.0*(1.0 + nu)), (E * nu)/((1.0 - 2.0*nu)*(1.0 + nu))
+        V_u = VectorFunctionSpace(mesh, 'CG', 1)
+        alpha = crack_band(FunctionSpace(mesh, 'CG', 1), crack[0], crack[1], ell)
+        u, du, v = Function(V_u), TrialFunction(V_u), TestFunction(V_u)
+        eps_du = sym(grad(du))
+        a_u = a(alpha, a_1)*inner(2.0*mu*eps_du + lmbda*tr(eps_du)*Identity(2), sym(grad(v)))*dx
+        L_u = dot(Constant((0.0, 0.0)), v)*dx
+        A, b = assemble_system(a_u, L_u, boundary_conditions(V_u))
+        as_backend_type(A).set_near_nullspace(build_nullspace(V_u, u.vector()))
+        u_ref = None
+        for solver in solvers:
+            linear_solver = PETScKrylovSolver()
+            linear_solver.set_options_prefix(solver+"_")
+            linear_solver.set_from_options()
+            u.vector().zero()
+            t_start = time.time()
+            linear_solver.set_operator(A)
+            linear_solver.solve(u.vector(), b)
+            t_solve = time.time() - t_start
+            if u_ref is None:
+                u_ref = u.vector().copy()                         # MUMPS solution as reference
+            error = (u.vector() - u_ref).norm('l2')/u_ref.norm('l2')
+            results.append((mesh_file, level, V_u.dim(), solver, t_solve, linear_solver.ksp().getIterationNumber(), error))
+            print("%-20s refinement %d, dofs %8d, %-12s time %9.4f sec, iterations %5d, error %.2e" %results[-1])
+
+# Summary of the benchmark
+print("\n%-20s %4s %9s %-12s %10s %6s %9s" %('mesh', 'ref', 'dofs', 'solver', 'time [s]', 'its', 'error'))
+for result in results:
+    print("%-20s %4d %9d %-12s %10.4f %6d %9.2e" %result)
@@ -0,0 +1,49 @@
+# This code is generated by Dr. Manish Kumar with the collaboration of Dr. Enrico Salvati and Dr. Roberto Alessi.
+# Contact email: Manish Kumar <mkumar2@me.iitr.ac.in>, Enrico Salvati <enrico.salvati@uniud.it>, Group website https://simed.uniud.it/
+# This code studies the accuracy and the cost of the quadrature degree of the nonlinear forms for the three specimens of src.
+# Each specimen script is run with the degree estimated by UFL and with the fixed degrees listed below. The peak load,
+# the load at the peak and the runtime are compared with the reference run that uses the estimated degree.
+# Copyright (C) <2023>  <Manish Kumar>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# All the required libraries are imported into the code
+import numpy as np
+import os
+from Specimen_runner import specimens, run_specimen
+
+# Study data
+degrees = [None, 2, 3, 4, 6]          # quadrature degrees of all the nonlinear forms, None for the degree estimated by UFL
+peak_tolerance = 0.01                 # admissible relative error of the peak load
+work_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'quadrature_study')
+
+results = []
+for (script, mesh_file) in specimens:
+    peak_ref = None
+    for degree in degrees:
+        name = "%s_q%s" %(os.path.splitext(script)[0], degree if degree is not None else 'ufl')
+        quadrature_degree = dict((form, degree) for form in ['E_u', 'Jd', 'energy', 'E_alpha', 'E_alpha_alpha'])
+        (runtime, forces) = run_specimen(script, mesh_file, {'quadrature_degree': quadrature_degree}, work_dir, name)
+        i_peak = np.argmax(np.abs(forces[:, 1]))
+        peak = abs(forces[i_peak, 1])
+        if peak_ref is None:
+            peak_ref = peak                                            # estimated degree as reference
+        error = abs(peak - peak_ref)/peak_ref
+        results.append((script, str(degree) if degree is not None else 'ufl', peak, abs(forces[i_peak, 0]), error, runtime, 'yes' if error <= peak_tolerance else 'no'))
+        print("%-26s degree %4s, peak load %.6g at %.6g, error %.2e, runtime %9.1f sec, within tolerance: %s" %results[-1])
+
+# Summary of the study
+print("\n%-26s %6s %12s %12s %10s %12s %6s" %('specimen', 'degree', 'peak load', 'at disp.', 'error', 'runtime [s]', 'ok'))
+for result in results:
+    print("%-26s %6s %12.6g %12.6g %10.2e %12.1f %6s" %result)
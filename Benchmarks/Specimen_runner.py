@@ -0,0 +1,53 @@
+# This code is generated by Dr. Manish Kumar with the collaboration of Dr. Enrico Salvati and Dr. Roberto Alessi.
+# Contact email: Manish Kumar <mkumar2@me.iitr.ac.in>, Enrico Salvati <enrico.salvati@uniud.it>, Group website https://simed.uniud.it/
+# This code runs modified copies of the specimen scripts of src for the benchmarks and studies of this folder. The option
+# lines of a script are replaced, its mesh and result directory are redirected, and the copy is run in a separate process.
+# Copyright (C) <2023>  <Manish Kumar>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# All the required libraries are imported into the code
+import numpy as np
+import os, re, subprocess, sys, time
+
+src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+input_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Input_data')
+
+# specimen script and mesh of Input_data (None for the meshes generated in the script), the L-shaped specimen uses the coarse mesh
+specimens = [('Uniaxial_bar.py', None),
+             ('3_point_bend_specimen.py', '3_pt_bend.xml'),
+             ('L_shaped_specimen.py', 'L_shape_coarse.xml')]
+
+def specimen_script(script, mesh_file, options, savedir):
+    """Source of the specimen script with the given option values, mesh and result directory"""
+    source = open(os.path.join(src_dir, script)).read()
+    options = dict(options, savedir=savedir)
+    for (name, value) in options.items():
+        source = re.sub(r"^%s = .*$" %name, lambda m: "%s = %r" %(name, value), source, count=1, flags=re.M)
+    if mesh_file is not None:
+        source = re.sub(r"Mesh\('[^']*'\)", lambda m: "Mesh(%r)" %os.path.join(input_dir, mesh_file), source, count=1)
+    return source
+
+def run_specimen(script, mesh_file, options, work_dir, name):
+    """Run the modified specimen script, returns the wall time and the force displacement log"""
+    savedir = os.path.join(work_dir, name)
+    run_file = os.path.join(work_dir, name+'.py')
+    if not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+    with open(run_file, 'w') as f:
+        f.write(specimen_script(script, mesh_file, options, savedir))
+    t_start = time.time()
+    subprocess.check_call([sys.executable, run_file], cwd=work_dir)
+    wall_time = time.time() - t_start
+    return (wall_time, np.loadtxt(os.path.join(savedir, 'forces.txt')))
@@ -0,0 +1,117 @@
+# This code is generated by Dr. Manish Kumar with the collaboration of Dr. Enrico Salvati and Dr. Roberto Alessi.
+# Contact email: Manish Kumar <mkumar2@me.iitr.ac.in>, Enrico Salvati <enrico.salvati@uniud.it>, Group website https://simed.uniud.it/
+# This code compares two formulations of the spectral split of the 2D scripts: the former eigenvector construction, built
+# separately for the positive and negative parts of the strain, and the shared projector-based decomposition with the energy
+# written in the eigenvalues. It reports the form compilation time, the size of the generated code and the assembly time
+# of the total energy, of its first derivative E_u and of the Jacobian Jd on the meshes of Input_data.
+# Copyright (C) <2023>  <Manish Kumar>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# All the required libraries are imported into the code
+from fenics import *               # FEniCS library
+from ffc.compiler import compile_form
+import ffc
+import numpy as np
+import os, time
+
+parameters["form_compiler"]["cpp_optimize"] = True
+
+# Benchmark data
+num_assemblies = 5                    # repetitions of each assembly
+tol_v = 1e-20
+input_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Input_data')
+
+# mesh file, Young's modulus, Poisson ratio, characteristic length (same as the specimen scripts)
+specimens = [('3_pt_bend.xml', 20000., 0.2, 1.5),
+             ('L_shape_coarse.xml', 25850., 0.18, 5.)]
+
+def a(alpha):
+    """Stiffness modulation of the 3-point bend specimen (Cornelissen softening)"""
+    a_1, a_2, a_3 = Constant(1046.3/pi), 1.3868, 0.6567
+    Q_d = a_1*alpha + a_1*a_2*alpha**2 + a_1*a_2*a_3*alpha**3
+    return ((1-alpha)**2)/((1-alpha)**2 + Q_d) + Constant(1.e-6)
+
+def energy_eigenvectors(u, mu, lmbda):
+    """Positive and negative energies with the former eigenvector construction, repeated for each part"""
+    def eps_part(u, sign, shift):
+        A = sym(grad(u))
+        a, b, c, d = A[0,0], A[0,1], A[1,0], A[1,1]
+        eig_1 = ((tr(A) + sqrt(tr(A)**2-4*det(A) + tol_v))/2)
+        eig_2 = ((tr(A) - sqrt(tr(A)**2-4*det(A) + tol_v))/2)
+        phi_1 = (eig_1 - b - d)/(a + c - eig_1)
+        phi_2 = (eig_2 - b - d)/(a + c - eig_2)
+        eig_v_1 = [phi_1/sqrt(phi_1**2 + 1)+shift, 1/sqrt(phi_1**2 + 1)]
+        eig_v_2 = [phi_2/sqrt(phi_2**2 + 1)+shift, 1/sqrt(phi_2**2 + 1)]
+        sn = 0.5*(eig_1 + sign*abs(eig_1))*np.outer(eig_v_1,eig_v_1) + 0.5*(eig_2 + sign*abs(eig_2))*np.outer(eig_v_2,eig_v_2)
+        return as_matrix(sn.tolist())
+    e = sym(grad(u))
+    energy_1 = 0.5*lmbda*(0.5*(tr(e) + abs(tr(e))))**2 + mu*tr(eps_part(u, 1., 0.)*eps_part(u, 1., 0.))
+    energy_2 = 0.5*lmbda*(0.5*(tr(e) - abs(tr(e))))**2 + mu*tr(eps_part(u, -1., tol_v)*eps_part(u, -1., tol_v))
+    return (energy_1, energy_2)
+
+def energy_projectors(u, mu, lmbda):
+    """Positive and negative energies with one shared decomposition, written in the eigenvalues"""
+    e = sym(grad(u))
+    delta = sqrt(tr(e)**2 - 4*det(e) + tol_v)
+    eig_1, eig_2 = (tr(e) + delta)/2, (tr(e) - delta)/2
+    energy_1 = 0.5*lmbda*(0.5*(tr(e) + abs(tr(e))))**2 + mu*((0.5*(eig_1 + abs(eig_1)))**2 + (0.5*(eig_2 + abs(eig_2)))**2)
+    energy_2 = 0.5*lmbda*(0.5*(tr(e) - abs(tr(e))))**2 + mu*((0.5*(eig_1 - abs(eig_1)))**2 + (0.5*(eig_2 - abs(eig_2)))**2)
+    return (energy_1, energy_2)
+
+formulations = [('eigenvectors', energy_eigenvectors), ('projectors', energy_projectors)]
+
+def compile_statistics(form, name):
+    """Time of the FFC code generation and size of the generated code"""
+    t_start = time.time()
+    code = compile_form([form], prefix=name, parameters=ffc.default_parameters())
+    return (time.time() - t_start, sum(len(c) for c in code[:2]))
+
+def assembly_time(form):
+    """Average assembly time, the first (JIT) assembly is excluded"""
+    tensor = assemble(form)
+    t_start = time.time()
+    for i in range(num_assemblies):
+        if len(form.arguments()) > 0:
+            assemble(form, tensor=tensor)
+        else:
+            assemble(form)
+    return (time.time() - t_start)/num_assemblies
+
+results = []
+for (mesh_file, E, nu, ell) in specimens:
+    mesh = Mesh(os.path.join(input_dir, mesh_file))
+    mu, lmbda = E/(2.0*(1.0 + nu)), (E * nu)/((1.0 - 2.0*nu)*(1.0 + nu))
+    V_u, V_alpha = VectorFunctionSpace(mesh, 'CG', 1), FunctionSpace(mesh, 'CG', 1)
+    u, du, v = Function(V_u), TrialFunction(V_u), TestFunction(V_u)
+    u.interpolate(Expression(('1.e-4*x[0] + 2.e-5*x[1]', '-3.e-5*x[0] + 1.e-4*sin(x[0]/50.)*x[1]'), degree=2))   # strains of both signs
+    alpha = interpolate(Expression('0.5*exp(-fabs(x[0] - 225.)/10.)', degree=1), V_alpha)
+    values = []
+    for (name, energy) in formulations:
+        (energy_1, energy_2) = energy(u, mu, lmbda)
+        total_energy = (a(alpha)*energy_1 + energy_2)*dx
+        E_u = derivative(total_energy, u, v)
+        Jd = derivative(E_u, u, du)
+        for (form_name, form) in [('energy', total_energy), ('E_u', E_u), ('Jd', Jd)]:
+            (t_compile, code_size) = compile_statistics(form, name+'_'+form_name)
+            t_assembly = assembly_time(form)
+            results.append((mesh_file, name, form_name, t_compile, code_size, t_assembly))
+            print("%-20s %-14s %-8s compile %8.3f sec, code %9d chars, assembly %9.5f sec" %results[-1])
+        values.append(assemble(total_energy))
+    print("%-20s relative difference of the energies: %.3e" %(mesh_file, abs(values[1] - values[0])/abs(values[0])))
+
+# Summary of the benchmark
+print("\n%-20s %-14s %-8s %12s %12s %14s" %('mesh', 'split', 'form', 'compile [s]', 'code [chars]', 'assembly [s]'))
+for result in results:
+    print("%-20s %-14s %-8s %12.3f %12d %14.5f" %result)
@@ -26,11 +26,16 @@ import matplotlib.pyplot as plt    # Plotting Library
 from ufl import nabla_div
 import numpy as np
 from ufl import replace
+from ufl.algorithms import expand_derivatives, extract_coefficients
+from ufl.algorithms.estimate_degrees import estimate_total_polynomial_degree
+import ufl, FIAT
 import sys, os, shutil, math
 from numpy.linalg import eig
 from dolfin import *
 from numpy import array
 import time
+import multiprocessing, queue, atexit
+from petsc4py import PETSc
 
 # to record the computation time
 comp_start = time.time()
@@ -107,46 +112,14 @@ bcf = DirichletBC(V_u, Constant((0.0,0.0)), boundary_D_f, method='pointwise') #
 
 
 # define functions
-# Positive part of the decomposed strain
-def eps_positive(u):    
+# Spectral decomposition of the strain, shared by its positive and negative parts
+def spectral_decomposition(u):
+    """Eigenvalues of the 2D strain tensor, tol_v keeps eig_1 - eig_2 > 0"""
     A = sym(grad(u))
-    a = A[0,0]
-    b = A[0,1]
-    c = A[1,0]
-    d = A[1,1]
-    eig_1 = ((tr(A) + sqrt(tr(A)**2-4*det(A) + tol_v))/2)
-    eig_2 = ((tr(A) - sqrt(tr(A)**2-4*det(A) + tol_v))/2)
-    phi_1 = (eig_1 - b - d)/(a + c - eig_1)
-    phi_2 = (eig_2 - b - d)/(a + c - eig_2)
-
-    eig_v_1 = [phi_1/sqrt(phi_1**2 + 1), 1/sqrt(phi_1**2 + 1)]
-    eig_v_2 = [phi_2/sqrt(phi_2**2 + 1), 1/sqrt(phi_2**2 + 1)]
-
-    # Positive Strain Tensor
-    sn_P = 0.5*(eig_1 + abs(eig_1))*np.outer(eig_v_1,eig_v_1) + 0.5*(eig_2 + abs(eig_2))*np.outer(eig_v_2,eig_v_2)
-    sn_1 = as_matrix(sn_P.tolist())
-    return sn_1
-
-# Negative part of the decomposed strain
-def eps_negative(u):    
-    A = sym(grad(u))
-    a = A[0,0]
-    b = A[0,1]
-    c = A[1,0]
-    d = A[1,1]
-    eig_1 = ((tr(A) + sqrt(tr(A)**2-4*det(A) + tol_v))/2)
-    eig_2 = ((tr(A) - sqrt(tr(A)**2-4*det(A) + tol_v))/2)
-    phi_1 = (eig_1 - b - d)/(a + c - eig_1)
-    phi_2 = (eig_2 - b - d)/(a + c - eig_2)
-
-    eig_v_1 = [phi_1/sqrt(phi_1**2 + 1), 1/sqrt(phi_1**2 + 1)]
-    eig_v_2 = [phi_2/sqrt(phi_2**2 + 1), 1/sqrt(phi_2**2 + 1)]
-
-         
-    # Negative Strain Tensor
-    sn_N = 0.5*(eig_1 - abs(eig_1))*np.outer(eig_v_1,eig_v_1) + 0.5*(eig_2 - abs(eig_2))*np.outer(eig_v_2,eig_v_2)
-    sn_1 = as_matrix(sn_N.tolist())
-    return sn_1
+    delta = sqrt(tr(A)**2 - 4*det(A) + tol_v)                     # eig_1 - eig_2
+    eig_1 = (tr(A) + delta)/2
+    eig_2 = (tr(A) - delta)/2
+    return (eig_1, eig_2)
 
 
 def w(alpha):
@@ -194,24 +167,131 @@ lb = interpolate(initial_alpha, V_alpha)          # Apply lower limit
 ub = interpolate(Constant("1."), V_alpha)         # Apply upper limit
 
 # Governing Equations
-elastic_energy_1 = 0.5*lmbda*(0.5*(tr(eps(u)) + abs(tr(eps(u)))))**2 + mu*tr(eps_positive(u)*eps_positive(u))            # Positive part of strain energy
-elastic_energy_2 = 0.5*lmbda*(0.5*(tr(eps(u)) - abs(tr(eps(u)))))**2 + mu*tr(eps_negative(u)*eps_negative(u))            # Positive part of strain energy
-elastic_energy = ((a(alpha))*elastic_energy_1 + elastic_energy_2)*thickness*dx                                           # strain energy
+# Parameters of the fully damaged nodes
+freeze_cracked = False                # True to pin the nodes with alpha >= 1 - cracked_tol and drop the fully cracked cells from the degraded elastic energy
+cracked_tol = 1.e-3
+cracked_cells = MeshFunction("size_t", mesh, mesh.topology().dim(), 0)     # 1 for the cells with only fully damaged nodes
+dx_elastic = Measure("dx", domain=mesh, subdomain_data=cracked_cells)(0) if freeze_cracked else dx
+
+# Split of the elastic energy into the degraded part elastic_energy_1 and the undegraded part elastic_energy_2
+energy_split = 'spectral'             # 'none', 'vol-dev' (Amor), 'spectral' (Miehe) or 'hybrid' (isotropic u problem, spectral driving force)
+
+if energy_split == 'none':
+    elastic_energy_1 = 0.5*inner(sigma_0(u), eps(u))
+    elastic_energy_2 = Constant(0.0)                              # no undegraded part, left out of the energy form (a Constant has no integration domain)
+elif energy_split == 'vol-dev':
+    kappa = lmbda + 2.0*mu/ndim                                   # bulk modulus
+    elastic_energy_1 = 0.5*kappa*(0.5*(tr(eps(u)) + abs(tr(eps(u)))))**2 + mu*inner(dev(eps(u)), dev(eps(u)))
+    elastic_energy_2 = 0.5*kappa*(0.5*(tr(eps(u)) - abs(tr(eps(u)))))**2
+else:
+    (eig_1, eig_2) = spectral_decomposition(u)                   # one decomposition, the energies are written in the eigenvalues
+    elastic_energy_1 = 0.5*lmbda*(0.5*(tr(eps(u)) + abs(tr(eps(u)))))**2 + mu*((0.5*(eig_1 + abs(eig_1)))**2 + (0.5*(eig_2 + abs(eig_2)))**2)   # Positive part of strain energy
+    elastic_energy_2 = 0.5*lmbda*(0.5*(tr(eps(u)) - abs(tr(eps(u)))))**2 + mu*((0.5*(eig_1 - abs(eig_1)))**2 + (0.5*(eig_2 - abs(eig_2)))**2)   # Negative part of strain energy
+elastic_energy = (a(alpha))*elastic_energy_1*thickness*dx_elastic                                                      # strain energy
+if energy_split != 'none':
+    elastic_energy += elastic_energy_2*thickness*dx                                                                      # undegraded part, also on the cracked cells
 dissipated_energy = Gc/float(c_w)*(w(alpha)/ell + ell*dot(grad(alpha), grad(alpha)))*thickness*dx                        # Dissipation Energy
-total_energy = elastic_energy + dissipated_energy                                                                        # total energy
+if energy_split == 'hybrid':
+    elastic_energy_u = (a(alpha))*0.5*inner(sigma_0(u), eps(u))*thickness*dx_elastic                  # isotropic degradation, the u problem is linear
+else:
+    elastic_energy_u = elastic_energy
+total_energy = elastic_energy_u + dissipated_energy                                                                        # total energy, elastic_energy drives the phase field
 
 # First and second directional derivative wrt displacement field
 E_u = derivative(total_energy,u,v)
 Jd = derivative(E_u, u, du)
 
+# Parameters of the active subdomain of the phase field subproblem, a bound tightening of the TAO solve: the problem keeps its size,
+# the dofs away from the damaged and driven nodes are fixed by ub = lb and the phase field forms are assembled on the active cells only
+active_set = False                    # True to fix the phase field away from the damaged and driven nodes (irreversibility = 'bounds' only)
+active_buffer = 2.                    # width of the buffer around them, in multiples of ell
+active_cells = MeshFunction("size_t", mesh, mesh.topology().dim(), 1)      # 1 for the cells assembled in the phase field subproblem
+dx_damage = Measure("dx", domain=mesh, subdomain_data=active_cells)
+
+# Parameters for the phase field subproblem
+damage_energy_cache = False           # True to evaluate the positive elastic energy density once per staggered iteration
+psi_degree = 2                        # quadrature degree of the stored elastic energy density
+irreversibility = 'bounds'            # 'bounds' for the TAO bound constraints, 'history' for the history field H = max(psi) and a linear solve (AT2-type models),
+                                      # 'penalty' or 'augmented_lagrangian' for a penalty term and a Newton solve
+if active_set and irreversibility != 'bounds':
+    print("active_set only tightens the bounds of the TAO solve, it is not used with irreversibility = '%s'" %irreversibility)
+    active_set = False
+
+# Positive elastic energy density stored at the quadrature points, as u is frozen during the phase field solution
+dx_q = dx_damage(metadata={'quadrature_degree': psi_degree, 'quadrature_scheme': 'default'})
+V_q = FunctionSpace(mesh, FiniteElement('Quadrature', mesh.ufl_cell(), psi_degree, quad_scheme='default'))
+psi_plus = Function(V_q)
+if damage_energy_cache or irreversibility == 'history':
+    psi_solver = LocalSolver(TrialFunction(V_q)*TestFunction(V_q)*dx_q, elastic_energy_1*TestFunction(V_q)*dx_q)    # pointwise evaluation of the energy density
+    psi_solver.factorize()
+if damage_energy_cache:
+    damage_elastic_energy = a(alpha)*psi_plus*thickness*dx_q(1) # elastic_energy_2 does not depend on the phase field
+else:
+    damage_elastic_energy = ((a(alpha))*elastic_energy_1 + elastic_energy_2)*thickness*dx_damage(1) if active_set else elastic_energy
+damage_energy = damage_elastic_energy + dissipated_energy                 # energy of the phase field subproblem
+
+def update_energy_density():
+    """Evaluate the positive elastic energy density at the quadrature points for the current displacement"""
+    psi_solver.solve_local_rhs(psi_plus)
+
 # First and second directional derivative wrt phase field
-E_alpha = derivative(total_energy,alpha,beta)
+E_alpha = derivative(damage_energy,alpha,beta)
 E_alpha_alpha = derivative(E_alpha,alpha,dalpha)
 
+# Parameters for the dissipation part of the phase field subproblem
+dissipation_preassembled = True       # True to assemble the dissipation operators once, valid if w(alpha) is at most quadratic
+
+if dissipation_preassembled and w(3.) - 3*w(2.) + 3*w(1.) - w(0.) != 0:            # third finite difference of w(alpha)
+    print('w(alpha) is not quadratic, the dissipation operators are assembled at every call')
+    dissipation_preassembled = False
+if dissipation_preassembled:
+    alpha_zero = Function(V_alpha)
+    E_diss_alpha = derivative(dissipated_energy,alpha,beta)
+    K_diss = assemble(derivative(E_diss_alpha,alpha,dalpha))                        # constant Hessian of the dissipation
+    b_diss = assemble(replace(E_diss_alpha, {alpha: alpha_zero}))                   # constant part of the gradient of the dissipation
+    Kx_diss = b_diss.copy()
+    E_el_alpha = derivative(damage_elastic_energy,alpha,beta)                         # alpha-dependent elastic coupling
+    E_el_alpha_alpha = derivative(E_el_alpha,alpha,dalpha)
+
+# Quadrature degree of the nonlinear forms, None to keep the degree estimated by UFL
+quadrature_degree = {'E_u': None, 'Jd': None, 'energy': None, 'E_alpha': None, 'E_alpha_alpha': None}
+
+def on_quadrature_space(itg):
+    """True if the integrand holds a function of a quadrature space, the degree of the integral is then fixed by that space"""
+    return any(c.ufl_element().family() == 'Quadrature' for c in extract_coefficients(itg.integrand()))
+
+def with_quadrature_degree(form, degree):
+    """Form with the given quadrature degree on all its integrals, except the integrals of the stored energy density (psi_degree)"""
+    if degree is None:
+        return form
+    return ufl.Form([itg if on_quadrature_space(itg) else itg.reconstruct(metadata=dict(itg.metadata(), quadrature_degree=degree))
+                     for itg in form.integrals()])
+
+def report_quadrature(name, form):
+    """Print the quadrature degree and the number of quadrature points per cell of each integral of the form"""
+    for itg in expand_derivatives(form).integrals():
+        degree = itg.metadata().get('quadrature_degree', estimate_total_polynomial_degree(itg.integrand()))
+        num_points = len(FIAT.create_quadrature(FIAT.ufc_simplex(mesh.topology().dim()), degree).get_points())
+        print("%-14s quadrature degree %3d, %5d points per cell" %(name, degree, num_points))
+
+E_u = with_quadrature_degree(E_u, quadrature_degree['E_u'])
+Jd = with_quadrature_degree(Jd, quadrature_degree['Jd'])
+damage_energy = with_quadrature_degree(damage_energy, quadrature_degree['energy'])
+damage_elastic_energy = with_quadrature_degree(damage_elastic_energy, quadrature_degree['energy'])
+E_alpha = with_quadrature_degree(E_alpha, quadrature_degree['E_alpha'])
+E_alpha_alpha = with_quadrature_degree(E_alpha_alpha, quadrature_degree['E_alpha_alpha'])
+if dissipation_preassembled:
+    E_el_alpha = with_quadrature_degree(E_el_alpha, quadrature_degree['E_alpha'])
+    E_el_alpha_alpha = with_quadrature_degree(E_el_alpha_alpha, quadrature_degree['E_alpha_alpha'])
+for (name, form) in [('E_u', E_u), ('Jd', Jd), ('energy', damage_energy), ('E_alpha', E_alpha), ('E_alpha_alpha', E_alpha_alpha)]:
+    report_quadrature(name, form)
+
 # define loading steps
 num_steps = 3200                     # total number of load steps
 num_of_large_load_step = 3200           # number of large load steps
 total_disp = 0.8                     # total applied displacement
+load_control = 'fixed'               # 'fixed' for the load steps defined here, 'adaptive' for the automatic step size controller
+disp_step = total_disp/num_steps     # base increment of the adaptive load step controller
 
 
 u_R = Expression(('disp_A + disp_app*(n+1-B)'),disp_A = 0.0, disp_app = total_disp/(num_of_large_load_step), n=0., B=0., degree=0)          # Define loading as an expression so that it can be updated for next step
@@ -219,20 +299,207 @@ bct = DirichletBC(V_u.sub(1), u_R, boundary_D_t, method='pointwise')
 bc_disp = [bcb, bcf, bct]                                                              # Apply boundary conditions
 
 # Define class and solver parameters for the displacement field
-problem_u = NonlinearVariationalProblem(E_u, u, bc_disp, Jd)
-solver_u = NonlinearVariationalSolver(problem_u)
+u_linear_solver = 'mumps'             # 'mumps' for the LU factorisation, 'cg_gamg', 'cg_hypre', 'gmres_gamg' or 'gmres_hypre' for the Krylov solvers
+u_reuse_factorization = True          # True to keep one factorisation and reuse its symbolic analysis, False to redo it at every Newton iteration
+
+def build_nullspace(V, x):
+    """Rigid body modes of the displacement field, used as near-nullspace by the multigrid preconditioners"""
+    gdim = V.mesh().geometry().dim()
+    nullspace_basis = [x.copy() for i in range(3 if gdim == 2 else 6)]
+    for i in range(gdim):
+        V.sub(i).dofmap().set(nullspace_basis[i], 1.0)            # translations
+    V.sub(0).set_x(nullspace_basis[gdim], -1.0, 1)                # rotation in the x-y plane
+    V.sub(1).set_x(nullspace_basis[gdim], 1.0, 0)
+    if gdim == 3:
+        V.sub(0).set_x(nullspace_basis[4], 1.0, 2)                # rotation in the x-z plane
+        V.sub(2).set_x(nullspace_basis[4], -1.0, 0)
+        V.sub(2).set_x(nullspace_basis[5], 1.0, 1)                # rotation in the y-z plane
+        V.sub(1).set_x(nullspace_basis[5], -1.0, 2)
+    for x in nullspace_basis:
+        x.apply("insert")
+    basis = VectorSpaceBasis(nullspace_basis)
+    basis.orthonormalize()
+    return basis
+
+if u_linear_solver == 'mumps':
+    # LU factorisation with MUMPS through a persistent PETSc linear solver
+    PETScOptions.set("u_ksp_type", "preonly")
+    PETScOptions.set("u_pc_type", "lu")
+    PETScOptions.set("u_pc_factor_mat_solver_type", "mumps")
+else:
+    # Krylov solver with algebraic multigrid, the contrast of a(alpha) down to k_ell = 1e-6 needs a tight tolerance
+    null_space = build_nullspace(V_u, u.vector())
+    ksp_type, pc_type = u_linear_solver.split('_')
+    PETScOptions.set("u_ksp_type", ksp_type)
+    PETScOptions.set("u_ksp_rtol", 1.e-8)
+    PETScOptions.set("u_ksp_atol", 1.e-12)
+    PETScOptions.set("u_ksp_max_it", 2000)
+    PETScOptions.set("u_ksp_gmres_restart", 100)
+    PETScOptions.set("u_pc_type", pc_type)
+    if pc_type == 'gamg':
+        PETScOptions.set("u_pc_gamg_type", "agg")
+        PETScOptions.set("u_pc_gamg_agg_nsmooths", 1)
+        PETScOptions.set("u_pc_gamg_threshold", 0.02)            # keeps the weak couplings across the damaged band out of the aggregates
+        PETScOptions.set("u_mg_levels_ksp_type", "chebyshev")
+        PETScOptions.set("u_mg_levels_pc_type", "jacobi")
+        PETScOptions.set("u_mg_levels_esteig_ksp_type", "cg")
+    else:
+        PETScOptions.set("u_pc_hypre_type", "boomeramg")
+        PETScOptions.set("u_pc_hypre_boomeramg_strong_threshold", 0.5)
+        PETScOptions.set("u_pc_hypre_boomeramg_coarsen_type", "HMIS")
+        PETScOptions.set("u_pc_hypre_boomeramg_interp_type", "ext+i")
+        PETScOptions.set("u_pc_hypre_boomeramg_agg_nl", 2)
+        PETScOptions.set("u_pc_hypre_boomeramg_nodal_coarsen", 6)
+        PETScOptions.set("u_pc_hypre_boomeramg_vec_interp_variant", 3)  # interpolation of the rigid body modes
+
+# Statistics of the solvers reported at the end of the run
+solver_stats = {'time_u': 0., 'assembly_u': 0., 'linear_solve_u': 0., 'newton_u': 0, 'factorization_u': 0, 'steps': 0, 'staggered': 0, 'predictor_gain': 0., 'elastic_steps': 0, 'tao_alpha': 0, 'tao_skipped': 0, 'history_solves': 0, 'krylov_alpha': 0, 'penalty_solves': 0, 'newton_alpha': 0, 'violation_ir': 0., 'violation_exceeded': 0, 'cracked_nodes': 0, 'cracked_cells': 0, 'active_dofs': 0., 'active_updates': 0, 'krylov_u': 0, 'field_outputs': 0, 'output_time': 0.}
+PETSc.Log.begin()                     # the PETSc log counts the factorisations actually performed
+stage_u = PETSc.Log.Stage("displacement")      # displacement solves, apart from the phase field solves
+
+def factorization_log():
+    """Count and time of the symbolic and numerical LU factorisations of the displacement solves, from the PETSc log"""
+    return [(int(info['count']), info['time']) for info in [PETSc.Log.Event(name).getPerfInfo(stage_u.id) for name in ['MatLUFactorSym', 'MatLUFactorNum']]]
+
+class DisplacementProblem(NonlinearProblem):
+
+    def __init__(self):
+        NonlinearProblem.__init__(self)
+        self.assembler = SystemAssembler(Jd, E_u, bc_disp)
+
+    def F(self, b, x):
+        """Residual (first derivative)"""
+        t_start = time.time()
+        self.assembler.assemble(b, x)
+        if len(cracked_state['floating_u_dofs']) > 0:
+            b_local = b.get_local()
+            b_local[cracked_state['floating_u_dofs']] = 0.          # the floating dofs keep their values
+            b.set_local(b_local)
+            b.apply('insert')
+        solver_stats['assembly_u'] += time.time() - t_start
+
+    def J(self, A, x):
+        """Jacobian (second derivative)"""
+        t_start = time.time()
+        self.assembler.assemble(A)
+        if len(cracked_state['floating_u_dofs']) > 0:
+            A.ident_local(cracked_state['floating_u_dofs'])
+        if u_linear_solver != 'mumps':
+            as_backend_type(A).set_near_nullspace(null_space)
+        solver_stats['assembly_u'] += time.time() - t_start
+
+class DisplacementSolver(NewtonSolver):
+
+    def __init__(self):
+        NewtonSolver.__init__(self, mesh.mpi_comm(), PETScKrylovSolver(), PETScFactory.instance())
+        self.linear_solver().set_options_prefix("u_")
+        self.linear_solver().set_from_options()
+
+    def solver_setup(self, A, P, problem, iteration):
+        """Set the Jacobian on the persistent linear solver, PETSc only refactors numerically if the sparsity is unchanged"""
+        if u_linear_solver == 'mumps' and not u_reuse_factorization:
+            self.linear_solver().ksp().reset()                    # drop the factorisation and its symbolic analysis
+        self.linear_solver().set_operator(A)
+        solver_stats['factorization_u'] += 1
+        self.t_solve = time.time()
+
+    def update_solution(self, x, dx, relaxation_parameter, problem, iteration):
+        """Update of the displacement with the Newton increment"""
+        solver_stats['linear_solve_u'] += time.time() - self.t_solve
+        solver_stats['krylov_u'] += self.linear_solver().ksp().getIterationNumber()
+        x.axpy(-relaxation_parameter, dx)
+
+problem_u = DisplacementProblem()
+solver_u = DisplacementSolver()
 prm = solver_u.parameters
 
-prm["newton_solver"]["relative_tolerance"] = 2E-1
-prm["newton_solver"]["absolute_tolerance"] = 5E-3
-prm["newton_solver"]["convergence_criterion"] = "residual"
-prm["newton_solver"]["error_on_nonconvergence"] = True
-prm["newton_solver"]["linear_solver"] = 'mumps'
-prm["newton_solver"]["lu_solver"]["symmetric"] = False 
-prm["newton_solver"]["maximum_iterations"] = 5000
-prm["newton_solver"]["relaxation_parameter"] = 1.0
+prm["relative_tolerance"] = 2E-1
+prm["absolute_tolerance"] = 5E-3
+prm["convergence_criterion"] = "residual"
+prm["error_on_nonconvergence"] = True
+prm["maximum_iterations"] = 5000
+prm["relaxation_parameter"] = 1.0
+
+def solve_displacement():
+    """Newton solution of the displacement field"""
+    t_start = time.time()
+    stage_u.push()
+    (newton_iter, converged) = solver_u.solve(problem_u, u.vector())
+    stage_u.pop()
+    solver_stats['newton_u'] += newton_iter
+    solver_stats['time_u'] += time.time() - t_start
+
+# Parameters for the linear displacement subproblem
+u_problem_type = 'auto'               # 'auto' to detect it from Jd, 'linear' or 'nonlinear' to declare it
+
+if u_problem_type == 'auto':          # E_u is linear in u if Jd does not depend on u (energy_split 'none' or 'hybrid')
+    u_problem_type = 'nonlinear' if u in extract_coefficients(expand_derivatives(Jd)) else 'linear'
+if u_problem_type == 'linear':
+    L_u = dot(Constant((0.0, 0.0)), v)*dx                     # no body force acts on the specimen
+    assembler_u = SystemAssembler(Jd, L_u, bc_disp)
+    A_u, b_u = PETScMatrix(), PETScVector()
+    solver_u_lin = solver_u.linear_solver()                   # same options (prefix u_) as the Newton solver
+    alpha_u = Function(V_alpha)                               # phase field of the current operator
 
-prm["newton_solver"]["krylov_solver"]["nonzero_initial_guess"] = True 
+def solve_displacement_linear():
+    """Direct solution of the linear displacement problem, the operator is reused while alpha is unchanged"""
+    t_start = time.time()
+    stage_u.push()
+    if A_u.empty() or (alpha.vector() - alpha_u.vector()).norm('linf') > 0.0:
+        assembler_u.assemble(A_u)
+        if len(cracked_state['floating_u_dofs']) > 0:
+            A_u.ident_local(cracked_state['floating_u_dofs'])
+        if u_linear_solver != 'mumps':
+            as_backend_type(A_u).set_near_nullspace(null_space)
+        if not u_reuse_factorization:
+            solver_u_lin.ksp().reset()                        # drop the factorisation and its symbolic analysis
+        solver_u_lin.set_operator(A_u)
+        alpha_u.assign(alpha)
+        solver_stats['factorization_u'] += 1
+    assembler_u.assemble(b_u)
+    if len(cracked_state['floating_u_dofs']) > 0:
+        b_local = b_u.get_local()
+        b_local[cracked_state['floating_u_dofs']] = u.vector().get_local()[cracked_state['floating_u_dofs']]   # the floating dofs keep their values, as in the Newton path
+        b_u.set_local(b_local)
+        b_u.apply('insert')
+    t_solve = time.time()
+    solver_u_lin.solve(u.vector(), b_u)
+    stage_u.pop()
+    solver_stats['krylov_u'] += solver_u_lin.ksp().getIterationNumber()
+    solver_stats['assembly_u'] += t_solve - t_start
+    solver_stats['linear_solve_u'] += time.time() - t_solve
+    solver_stats['time_u'] += time.time() - t_start
+
+def print_solver_stats():
+    """Print the time breakdown of the displacement solver"""
+    print("Displacement solver: %.4g sec in total, %.4g sec assembly, %.4g sec linear solves" %(solver_stats['time_u'], solver_stats['assembly_u'], solver_stats['linear_solve_u']))
+    print("Newton iterations: %d, operator updates: %d" %(solver_stats['newton_u'], solver_stats['factorization_u']))
+    ((n_sym, t_sym), (n_num, t_num)) = factorization_log()
+    if n_num > 0:
+        print("LU factorisations: %d symbolic in %.4g sec, %d numerical in %.4g sec" %(n_sym, t_sym, n_num, t_num))
+        if u_reuse_factorization and n_sym > 0:
+            print("Without reuse of the symbolic analysis: %d symbolic factorisations, %.4g sec more at the measured average" %(n_num, (n_num - n_sym)*t_sym/n_sym))
+    if solver_stats['factorization_u'] > 0:
+        print("Average linear solve: %.4g sec" %(solver_stats['linear_solve_u']/solver_stats['factorization_u']))
+    if u_linear_solver != 'mumps':
+        print("Krylov iterations (%s): %d" %(u_linear_solver, solver_stats['krylov_u']))
+    if solver_stats['steps'] > 1:
+        print("Predictor '%s': average distance to the converged displacement %.3g of the previous step, %.3g Newton and %.3g staggered iterations per step"
+              %(predictor, solver_stats['predictor_gain']/(solver_stats['steps'] - 1), solver_stats['newton_u']/solver_stats['steps'], solver_stats['staggered']/solver_stats['steps']))
+    if elastic_shortcut:
+        print("Elastic steps solved by scaling: %d" %(solver_stats['elastic_steps']))
+    if tao_skip_check:
+        print("Phase field solves: %d, skipped by the driving force check: %d" %(solver_stats['tao_alpha'], solver_stats['tao_skipped']))
+    if active_set and solver_stats['active_updates'] > 0:
+        print("Average fraction of active phase field dofs: %.3g" %(solver_stats['active_dofs']/solver_stats['active_updates']))
+    if irreversibility == 'history':
+        print("Phase field linear solves with the history field: %d, Krylov iterations: %d" %(solver_stats['history_solves'], solver_stats['krylov_alpha']))
+    if irreversibility in ['penalty', 'augmented_lagrangian']:
+        print("Phase field Newton solves (%s): %d, Newton iterations: %d" %(irreversibility, solver_stats['penalty_solves'], solver_stats['newton_alpha']))
+        print("Maximum violation of alpha >= lb: %.3g, solves above penalty_tol = %g: %d" %(solver_stats['violation_ir'], penalty_tol, solver_stats['violation_exceeded']))
+    if freeze_cracked:
+        print("Fully damaged nodes: %d, cells removed from the degraded elastic energy: %d" %(solver_stats['cracked_nodes'], solver_stats['cracked_cells']))
+    print("Field outputs: %d in %.4g sec" %(solver_stats['field_outputs'], solver_stats['output_time']))
 
 # Define class and solver parameters for the phase field
 class DamageProblem(OptimisationProblem):
@@ -240,29 +507,44 @@ class DamageProblem(OptimisationProblem):
     def f(self, x):
         """Function to be minimized"""
         alpha.vector()[:] = x
-        return assemble(total_energy)
+        if dissipation_preassembled:
+            K_diss.mult(x, Kx_diss)
+            return assemble(damage_elastic_energy) + b_diss.inner(x) + 0.5*Kx_diss.inner(x)
+        return assemble(damage_energy)
 
     def F(self, b, x):
         """Gradient (first derivative)"""
         alpha.vector()[:] = x
-        assemble(E_alpha, b)
+        if dissipation_preassembled:
+            assemble(E_el_alpha, b)
+            K_diss.mult(x, Kx_diss)
+            b.axpy(1.0, b_diss)
+            b.axpy(1.0, Kx_diss)
+        else:
+            assemble(E_alpha, b)
 
     def J(self, A, x):
         """Hessian (second derivative)"""
         alpha.vector()[:] = x
-        assemble(E_alpha_alpha, A)
+        if dissipation_preassembled:
+            assemble(E_el_alpha_alpha, A)
+            A.axpy(1.0, K_diss, True)                     # same sparsity pattern
+        else:
+            assemble(E_alpha_alpha, A)
 
 solver_alpha_tao = PETScTAOSolver()
 solver_alpha_tao.parameters.update({"method": "tron","linear_solver" : "umfpack","preconditioner" : "petsc_amg",
                                     "line_search": "gpcg", "report": False, "maximum_iterations": 10000, "gradient_absolute_tol": 8.0e-04, "gradient_relative_tol": 8.0e-04})
                                     
 # Boundary conditions for phase field
+bc_alpha = []
 def boundary_D_d_c(x, on_boundary):
      return x[1] <= 250.6+tol and x[0] >= 468.0-tol and x[0] <= 472.0 +tol 
 
 bc = DirichletBC(V_alpha, Constant(0.0), boundary_D_d_c,method='pointwise')         # define boundary condition
 bc.apply(lb.vector())                                  # Apply boundary condition on lower limit
 bc.apply(ub.vector())                                  # Apply boundary condition on upper limit
+bc_alpha.append(bc)
 
 def boundary_D_d_c(x, on_boundary):
      return x[1] <= 0.0 + tol
@@ -270,61 +552,646 @@ def boundary_D_d_c(x, on_boundary):
 bc = DirichletBC(V_alpha, Constant(0.0), boundary_D_d_c,method='pointwise')         # define boundary condition
 bc.apply(lb.vector())                                  # Apply boundary condition on lower limit
 bc.apply(ub.vector())                                  # Apply boundary condition on upper limit
+bc_alpha.append(bc)
+
+# Active set of the phase field, the other dofs are frozen at their lower bound. TAO still works on the full vectors,
+# and the gradient that seeds the active set is assembled over the whole domain at each staggered iteration
+ub_tao = ub                                                     # upper bound passed to TAO
+if active_set:
+    ub_tao = ub.copy(deepcopy=True)
+    E_alpha_seed = derivative(elastic_energy + dissipated_energy, alpha, beta)        # gradient over the whole domain
+    active_layers = int(math.ceil(active_buffer*ell/mesh.hmin()))
+    cells_vertices = mesh.cells()
+    dof_to_vertex = dof_to_vertex_map(V_alpha)
+
+def update_active_set():
+    """Active nodes: damaged nodes, nodes with a negative energy gradient and active_layers of neighbours around them"""
+    g = assemble(E_alpha_seed).get_local()
+    seed = (g < 0.) | (alpha.vector().get_local() > 0.) | (lb.vector().get_local() > 0.)
+    vertex_active = np.zeros(mesh.num_vertices(), dtype=bool)
+    vertex_active[dof_to_vertex[seed]] = True
+    for i in range(active_layers):
+        vertex_active[cells_vertices[vertex_active[cells_vertices].any(axis=1)].ravel()] = True
+    active_cells.array()[:] = vertex_active[cells_vertices].any(axis=1)
+    dof_active = vertex_active[dof_to_vertex]
+    ub_tao.vector()[:] = np.where(dof_active, ub.vector().get_local(), lb.vector().get_local())
+    alpha.vector()[:] = np.where(dof_active, alpha.vector().get_local(), lb.vector().get_local())
+    solver_stats['active_dofs'] += np.count_nonzero(dof_active)/float(len(dof_active))
+    solver_stats['active_updates'] += 1
+
+# History field of the irreversibility, the phase field subproblem is then unconstrained
+history_pc_rebuild = 10               # solves between two rebuilds of the preconditioner of the phase field
+
+if irreversibility == 'history':
+    H, H_conv = Function(V_q), Function(V_q)                    # history field of the current and of the last converged step
+    history_energy = a(alpha)*H*thickness*dx_q + dissipated_energy
+    E_alpha_H = derivative(history_energy, alpha, beta)
+    E_alpha_alpha_H = derivative(E_alpha_H, alpha, dalpha)
+    if alpha in extract_coefficients(expand_derivatives(E_alpha_alpha_H)):
+        raise ValueError("irreversibility = 'history' needs a phase field subproblem quadratic in alpha (AT2-type w and a), "
+                         "the history energy of the other models is not bounded below")
+    A_H, b_H, dalpha_H = PETScMatrix(), PETScVector(), alpha.vector().copy()
+    PETScOptions.set("alpha_ksp_type", "cg")                    # the Hessian of AT2 is symmetric positive definite
+    PETScOptions.set("alpha_ksp_rtol", 1.e-10)
+    PETScOptions.set("alpha_pc_type", "hypre")
+    PETScOptions.set("alpha_pc_hypre_type", "boomeramg")
+    solver_alpha_lin = PETScKrylovSolver()
+    solver_alpha_lin.set_options_prefix("alpha_")
+    solver_alpha_lin.set_from_options()
+
+def solve_phase_field_history():
+    """Phase field driven by the history field, one linear solve as the subproblem is quadratic"""
+    psi_solver.solve_local_rhs(psi_plus)
+    H.vector()[:] = np.maximum(H_conv.vector().get_local(), psi_plus.vector().get_local())
+    assemble_system(E_alpha_alpha_H, E_alpha_H, bc_alpha, A_tensor=A_H, b_tensor=b_H)
+    solver_alpha_lin.set_reuse_preconditioner(solver_stats['history_solves'] % history_pc_rebuild != 0)
+    solver_alpha_lin.set_operator(A_H)
+    solver_alpha_lin.solve(dalpha_H, b_H)
+    alpha.vector().axpy(-1.0, dalpha_H)
+    solver_stats['history_solves'] += 1
+    solver_stats['krylov_alpha'] += solver_alpha_lin.ksp().getIterationNumber()
+    alpha.vector()[:] = np.clip(alpha.vector().get_local(), 0., 1.)        # round-off of the Krylov solve
+
+# Penalty or augmented Lagrangian irreversibility, the phase field subproblem is then solved by Newton without bounds
+penalty_tol = 0.01                    # admissible violation of alpha >= lb, sets the penalty parameter (Gerasimov and De Lorenzis 2019)
+
+if irreversibility in ['penalty', 'augmented_lagrangian']:
+    w_prime_0 = (w(1.e-8) - w(0.))/1.e-8
+    if w_prime_0 > 0.:
+        gamma_ir = Gc*w_prime_0/(float(c_w)*ell*penalty_tol)             # violation penalty_tol of the homogeneous solution without driving force
+    else:
+        gamma_ir = Gc/ell*(1./penalty_tol**2 - 1.)                       # AT2
+    gamma_ir = max(gamma_ir, Gc*ell/(float(c_w)*mesh.hmin()**2))         # not weaker than the gradient term on the smallest cell
+    lambda_ir = Function(V_alpha)                                        # multiplier of the augmented Lagrangian, zero for the penalty
+    g_ir = lambda_ir + gamma_ir*(alpha - lb)
+    penalty_energy = 1./(2.*gamma_ir)*((0.5*(g_ir - abs(g_ir)))**2 - lambda_ir**2)*thickness*dx
+    E_alpha_P = derivative(damage_energy + penalty_energy, alpha, beta)
+    E_alpha_alpha_P = derivative(E_alpha_P, alpha, dalpha)
+    problem_alpha_P = NonlinearVariationalProblem(E_alpha_P, alpha, bc_alpha, E_alpha_alpha_P)
+    solver_alpha_P = NonlinearVariationalSolver(problem_alpha_P)
+    solver_alpha_P.parameters.update({"nonlinear_solver": "snes",
+                                      "snes_solver": {"method": "newtonls", "linear_solver": "mumps", "line_search": "bt",
+                                                      "maximum_iterations": 100, "absolute_tolerance": 1.e-8, "relative_tolerance": 1.e-8,
+                                                      "report": False, "error_on_nonconvergence": False}})
+
+def solve_phase_field_penalty():
+    """Phase field with the penalised irreversibility, the multiplier of the augmented Lagrangian is updated afterwards"""
+    (iter, converged) = solver_alpha_P.solve()
+    if not converged:
+        raise RuntimeError("The phase field Newton solver (%s) did not converge in %d iterations" %(irreversibility, iter))
+    alpha.vector()[:] = np.minimum(alpha.vector().get_local(), ub.vector().get_local())
+    violation = (lb.vector() - alpha.vector()).max()                # violation of alpha >= lb
+    solver_stats['violation_ir'] = max(solver_stats['violation_ir'], violation)
+    if violation > penalty_tol:
+        solver_stats['violation_exceeded'] += 1
+    if irreversibility == 'augmented_lagrangian':
+        lambda_ir.vector()[:] = np.minimum(0., lambda_ir.vector().get_local() + gamma_ir*(alpha.vector().get_local() - lb.vector().get_local()))
+    solver_stats['penalty_solves'] += 1
+    solver_stats['newton_alpha'] += iter
+
+# Fully damaged nodes, pinned at alpha = 1, and displacement dofs left without any intact cell
+cracked_state = {'floating_u_dofs': np.array([], dtype=np.intc)}
+if freeze_cracked:
+    u_cell_dofs = np.array([V_u.dofmap().cell_dofs(c) for c in range(mesh.num_cells())])
+    alpha_dof_to_vertex = dof_to_vertex_map(V_alpha)
+
+def freeze_cracked_nodes():
+    """Pin the nodes with alpha >= 1 - cracked_tol at the upper bound and drop the cells with only such nodes from the degraded elastic energy"""
+    cracked = alpha.vector().get_local() >= 1. - cracked_tol
+    for x in [lb, ub, alpha]:
+        x.vector()[:] = np.where(cracked, 1., x.vector().get_local())
+    vertex_cracked = np.zeros(mesh.num_vertices(), dtype=bool)
+    vertex_cracked[alpha_dof_to_vertex[cracked]] = True
+    cracked_cells.array()[:] = vertex_cracked[mesh.cells()].all(axis=1)
+    attached = np.zeros(V_u.dim(), dtype=bool)
+    attached[u_cell_dofs[cracked_cells.array() == 0].ravel()] = True
+    cracked_state['floating_u_dofs'] = np.where(np.logical_not(attached))[0].astype(np.intc)     # identity rows of the Jacobian, the dofs keep their values
+    solver_stats['cracked_nodes'] = np.count_nonzero(cracked)
+    solver_stats['cracked_cells'] = np.count_nonzero(cracked_cells.array())
 
-# Function to define the staggered solving procedure                                     
+# Parameters of the check of the damage driving force before the phase field solution
+tao_skip_check = False                # True to skip the TAO solve if no node can damage from the lower bound
+
+def damage_inactive():
+    """True if the projected gradient of the energy at alpha = lb vanishes, alpha = lb is then the solution"""
+    x, g = lb.vector().copy(), lb.vector().copy()
+    alpha_iterate = alpha.vector().copy()
+    DamageProblem().F(g, x)                                        # sets alpha = lb
+    free = ub_tao.vector().get_local() > lb.vector().get_local()
+    g_proj = np.minimum(g.get_local(), 0.)[free]                   # only a negative gradient can increase alpha
+    inactive = np.linalg.norm(g_proj) <= solver_alpha_tao.parameters["gradient_absolute_tol"]
+    if not inactive:
+        alpha.vector()[:] = alpha_iterate                          # TAO starts from the current staggered iterate
+    return inactive
+
+# Parameters for the acceleration of the staggered procedure
+anderson = False                      # True to apply the Anderson acceleration on the phase field iterations
+anderson_depth = 5                    # number of previous iterations kept in the Anderson history
+anderson_safeguard = 1.0              # restart with the plain iteration if the error grows by more than this factor
+
+def anderson_mixing(x_hist, g_hist):
+    """Anderson extrapolation of the phase field from the history of the staggered iterations"""
+    f_hist = [g - x for x, g in zip(x_hist, g_hist)]                               # residuals of the fixed point map
+    dF = np.column_stack([f_hist[i+1] - f_hist[i] for i in range(len(f_hist)-1)])
+    dG = np.column_stack([g_hist[i+1] - g_hist[i] for i in range(len(g_hist)-1)])
+    gamma = np.linalg.lstsq(dF, f_hist[-1], rcond=None)[0]                       # mixing coefficients
+    return g_hist[-1] - dG.dot(gamma)
+
+# Parameters for the inexact solution of the subproblems in the staggered procedure
+inexact_solves = False                # True to adapt the tolerances of the Newton and TAO solvers to the staggered error
+inexact_gamma = 0.1                   # the nominal tolerances are loosened by inexact_gamma*err_alpha/tol
+inexact_factor_max = 100.             # maximum loosening of the nominal tolerances
+tol_nominal = {'newton_rel': prm["relative_tolerance"], 'newton_abs': prm["absolute_tolerance"],
+               'tao_abs': solver_alpha_tao.parameters["gradient_absolute_tol"], 'tao_rel': solver_alpha_tao.parameters["gradient_relative_tol"]}
+inexact_state = {'err_first': 1.}     # staggered error after the first iteration of the previous load step
+
+def set_inner_tolerances(factor):
+    """Scale the nominal tolerances of the displacement and phase field solvers by the given factor"""
+    prm["relative_tolerance"] = max(tol_nominal['newton_rel'], min(0.9, factor*tol_nominal['newton_rel']))
+    prm["absolute_tolerance"] = factor*tol_nominal['newton_abs']
+    solver_alpha_tao.parameters["gradient_absolute_tol"] = factor*tol_nominal['tao_abs']
+    solver_alpha_tao.parameters["gradient_relative_tol"] = max(tol_nominal['tao_rel'], min(0.9, factor*tol_nominal['tao_rel']))
+
+def inexact_factor(err_alpha, tol):
+    """Loosening factor of the inner tolerances (Eisenstat-Walker type forcing term), 1 close to convergence"""
+    return min(inexact_factor_max, max(1., inexact_gamma*err_alpha/tol))
+
+# Function to define the staggered solving procedure
 def alternate_minimization(u,alpha,tol=8.e-4,maxiter=10000,alpha_0=interpolate(Constant("0.0"), V_alpha)):
     # initialization
     iter = 1; err_alpha = 1
+    alpha_0.assign(alpha)                           # reference for the error, also after a rejected load step
     alpha_error = Function(V_alpha)
-    # iteration loop
-    while err_alpha>tol and iter<maxiter:
+    x_hist, g_hist = [], []                         # history of the Anderson acceleration
+    factor = inexact_factor(inexact_state['err_first'], tol) if inexact_solves else 1.
+    factor_used = 1.
+    # iteration loop, with inexact solves the last iteration has to use the nominal tolerances
+    while (err_alpha>tol or factor_used>1.) and iter<maxiter:
+        if inexact_solves:
+            set_inner_tolerances(factor)
+            factor_used = factor
         # solve elastic problem
         print('Solution for displacement')
-        solver_u.solve()
+        if u_problem_type == 'linear':
+            solve_displacement_linear()
+        else:
+            solve_displacement()
 
         print('Solution for phase field')
 
         # solve phase field problem
-        solver_alpha_tao.solve(DamageProblem(), alpha.vector(), lb.vector(), ub.vector())# test error
+        if damage_energy_cache:
+            update_energy_density()
+        if active_set:
+            update_active_set()
+        if irreversibility == 'history':
+            solve_phase_field_history()
+        elif irreversibility in ['penalty', 'augmented_lagrangian']:
+            solve_phase_field_penalty()
+        elif tao_skip_check and damage_inactive():
+            solver_stats['tao_skipped'] += 1
+        else:
+            solver_alpha_tao.solve(DamageProblem(), alpha.vector(), lb.vector(), ub_tao.vector())
+            solver_stats['tao_alpha'] += 1
+        # test error
         alpha_error.vector()[:] = alpha.vector() - alpha_0.vector()
-        err_alpha = np.linalg.norm(alpha_error.vector().get_local(), ord = np.Inf) 
+        err_alpha_old = err_alpha
+        err_alpha = np.linalg.norm(alpha_error.vector().get_local(), ord = np.Inf)
+        if inexact_solves:
+            factor = inexact_factor(err_alpha, tol)
+            if iter == 1:
+                inexact_state['err_first'] = err_alpha
         # update iteration
         print("Iteration:  %2d, Error: %2.8g, alpha_max: %.8g" %(iter, err_alpha, alpha.vector().max()))
+        if anderson:
+            if len(g_hist) > 1 and err_alpha > anderson_safeguard*err_alpha_old:
+                x_hist, g_hist = [], []             # safeguard: restart from the plain iteration
+            x_hist.append(alpha_0.vector().get_local())
+            g_hist.append(alpha.vector().get_local())
+            x_hist, g_hist = x_hist[-anderson_depth-1:], g_hist[-anderson_depth-1:]
+            if len(g_hist) > 1:
+                alpha.vector()[:] = np.clip(anderson_mixing(x_hist, g_hist), lb.vector().get_local(), ub_tao.vector().get_local())
         alpha_0.assign(alpha)
         iter=iter+1
+    if inexact_solves:
+        set_inner_tolerances(1.)
     print("Iteration:  %2d, Error: %2.8g, alpha_max: %.8g" %(iter-1, err_alpha, alpha.vector().max()))
     return (err_alpha, iter)
+
+# Parameters for the monolithic solution of the coupled problem
+solver_scheme = 'staggered'           # 'staggered' for the alternate minimization, 'monolithic' for the coupled SNES VI solver
+
+if solver_scheme == 'monolithic':
+    if energy_split == 'hybrid':
+        raise ValueError("energy_split = 'hybrid' is not variational, the monolithic scheme would minimise the isotropic energy")
+    if freeze_cracked:
+        raise ValueError("freeze_cracked pins the floating nodes in the displacement solvers only, the mixed Jacobian would be singular at them")
+    V_m = FunctionSpace(mesh, MixedElement([V_u.ufl_element(), V_alpha.ufl_element()]))  # mixed space for (u, alpha)
+    w_m, w_lb, w_ub = Function(V_m), Function(V_m), Function(V_m)
+    u_m, alpha_m = split(w_m)
+    total_energy_m = replace(total_energy, {u: u_m, alpha: alpha_m})                      # total energy of the coupled problem
+    E_m = derivative(total_energy_m, w_m, TestFunction(V_m))
+    J_m = derivative(E_m, w_m, TrialFunction(V_m))
+    bc_m = [DirichletBC(V_m.sub(0).sub(1), Constant(0.0), boundary_D_b, method='pointwise'),
+            DirichletBC(V_m.sub(0), Constant((0.0,0.0)), boundary_D_f, method='pointwise'),
+            DirichletBC(V_m.sub(0).sub(1), u_R, boundary_D_t, method='pointwise')]               # same boundary conditions as bc_disp
+    assigner_m = FunctionAssigner(V_m, [V_u, V_alpha])                                    # (u, alpha) -> mixed function
+    assigner_u = FunctionAssigner(V_u, V_m.sub(0))                                        # mixed function -> u
+    assigner_alpha = FunctionAssigner(V_alpha, V_m.sub(1))                                # mixed function -> alpha
+    u_lb, u_ub = Function(V_u), Function(V_u)                                             # the displacement is not bounded
+    u_lb.vector()[:] = -1.e20
+    u_ub.vector()[:] = 1.e20
+    problem_m = NonlinearVariationalProblem(E_m, w_m, bc_m, J_m)
+    problem_m.set_bounds(w_lb, w_ub)                                                      # irreversibility through the bounds of the phase field
+    solver_m = NonlinearVariationalSolver(problem_m)
+    solver_m.parameters.update({"nonlinear_solver": "snes",
+                                "snes_solver": {"method": "vinewtonrsls", "linear_solver": "mumps", "line_search": "basic",
+                                                "maximum_iterations": 500, "absolute_tolerance": 1.e-6, "relative_tolerance": 1.e-6,
+                                                "report": True, "error_on_nonconvergence": False}})
+
+# Function to solve the coupled problem in one go
+def monolithic_minimization(u,alpha,maxiter=500):
+    t_start = time.time()
+    solver_m.parameters["snes_solver"]["maximum_iterations"] = maxiter
+    assigner_m.assign(w_m, [u, alpha])                  # start from the last converged state
+    assigner_m.assign(w_lb, [u_lb, lb])                 # update the bounds of the phase field
+    assigner_m.assign(w_ub, [u_ub, ub])
+    (iter, converged) = solver_m.solve()
+    assigner_u.assign(u, w_m.sub(0))
+    assigner_alpha.assign(alpha, w_m.sub(1))
+    print("Newton iterations:  %2d, converged: %s, time: %.3g sec, alpha_max: %.8g" %(iter, converged, time.time() - t_start, alpha.vector().max()))
+    return (converged, iter)
     
 savedir = "results/"                           # directory to export files
 if os.path.isdir(savedir):
     shutil.rmtree(savedir)
-file_alpha = File(savedir+"/alpha.pvd")        # define file name for phase field files
-file_u = File(savedir+"/u.pvd")                # define file name for displacement field files
+output_format = 'pvd'                # 'pvd' for one .vtu file per field and step, 'xdmf' for a single XDMF/HDF5 time series of all the fields
+if output_format == 'xdmf':
+    file_results = XDMFFile(mesh.mpi_comm(), savedir+"/results.xdmf")          # parallel HDF5 output, written by all the processes
+    file_peak = XDMFFile(mesh.mpi_comm(), savedir+"/peak.xdmf")                # snapshot at the peak load, written after later steps
+    for file_xdmf in [file_results, file_peak]:
+        file_xdmf.parameters["flush_output"] = True                           # readable while the run is going
+        file_xdmf.parameters["functions_share_mesh"] = True                   # one mesh for all the fields
+        file_xdmf.parameters["rewrite_function_mesh"] = False                # the mesh is written only once
+else:
+    pvd_names = {'damage': 'alpha', 'displacement': 'u'}
+    file_pvd = dict((field, File(savedir+"/"+name+".pvd")) for (field, name) in pvd_names.items())             # files of the fields, by field name
+    file_pvd_peak = dict((field, File(savedir+"/peak_"+name+".pvd")) for (field, name) in pvd_names.items())   # snapshot at the peak load
+
+def write_fields(fields, n, peak=False):
+    """Write the fields of the load step n with the selected output format, the peak snapshot goes to its own files"""
+    for field in fields:
+        if output_format == 'xdmf':
+            (file_peak if peak else file_results).write(field, float(n))
+        else:
+            (file_pvd_peak if peak else file_pvd)[field.name()] << (field, n)
+
+# Parameters of the force displacement log
+force_log_flush = 1                   # steps between two flushes of the log to the file, 0 to flush only at the end of the run
+force_log_fsync = False               # True to also force the flushed rows to disk with os.fsync
+
+class ForceLog:
+    """Append-only log with one row per load step, readable with np.loadtxt while the run is going"""
+
+    def __init__(self, filename, columns):
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        self.file = open(filename, 'w')
+        self.file.write('# ' + ' '.join(columns) + '\n')
+        self.rows = 0
+        self.t_start = time.time()
+
+    def write(self, row):
+        """Append a row, the wall time since the start of the log is added as last column"""
+        self.file.write(' '.join('%.10e' %x for x in row) + ' %.3f\n' %(time.time() - self.t_start))
+        self.rows += 1
+        if force_log_flush > 0 and self.rows % force_log_flush == 0:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        if force_log_fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+# the first two columns are the former forces.txt
+force_log = ForceLog(savedir+'/forces.txt', ['displacement', 'force', 'step', 'staggered_iterations', 'alpha_max', 'elastic_energy', 'dissipated_energy', 'wall_time'])
+force_log.write([0., 0., 0, 0, 0., 0., 0.])
 
 # initialization of vectors to store force and displacement
 forces = np.zeros((num_steps+1, 2))
 
+def load_displacement():
+    """Applied displacement and reaction force"""
+    return np.array([u(470.,250.)[1],assemble(sigma(u,alpha)[1,1]*thickness*ds(1))])
+
+# Parameters of the output scheduler of the fields, the force log is written at every step
+output_every = 25                      # steps between two outputs of the fields, 0 to disable
+output_dalpha = 0.                    # change of the phase field (max norm) since the last output that triggers an output, 0 to disable
+output_peak = False                   # True to write the fields at the peak load
+output_peak_drop = 0.01               # relative drop of the load that confirms a peak
+output_displacements = []             # applied displacements at which the fields are written
+output_state = {'alpha': Function(V_alpha), 'disp': 0., 'peak': 0., 'peak_step': -1, 'peak_written': True}
+u_peak, alpha_peak = Function(V_u), Function(V_alpha)        # fields at the largest load so far
+u_peak.rename('displacement','displacement')
+alpha_peak.rename('damage','damage')
+
+def write_snapshot(u_out, alpha_out, n, peak=False):
+    """Write the fields of the load step n with the selected output format"""
+    write_fields([alpha_out, u_out], n, peak)
+
+# Parameters of the background writer of the fields
+output_async = False                  # True to save the fields from a writer process forked from the solver and to write the output files at the end of the run (serial runs only)
+output_queue_size = 2                 # snapshots waiting to be saved, the solver waits when the queue is full
+output_timeout = 10.                  # seconds between two checks of the writer process while the solver waits
+snapshot_dir = savedir+"/snapshots"   # dof values of the fields saved by the writer process, removed once the output files are written
+
+class FieldWriter:
+    """Writer process forked from the solver, it saves the dof values received through a bounded queue as numpy arrays.
+    The child makes no MPI, PETSc or HDF5 call, the output files are written from the arrays by the solver process in close"""
+
+    def __init__(self, maxsize):
+        context = multiprocessing.get_context('fork')
+        self.queue = context.Queue(maxsize=maxsize)
+        self.errors = context.Queue()
+        self.snapshots = []                                  # (file, step, peak) of the snapshots sent to the writer
+        if not os.path.isdir(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        self.process = context.Process(target=self.run, daemon=True)
+        self.process.start()
+
+    def run(self):
+        """Loop of the writer process, numpy only"""
+        failed = False
+        for (file_name, u_values, alpha_values) in iter(self.queue.get, None):     # the queue is drained until the end, also after an error
+            if failed:
+                continue
+            try:
+                np.savez(file_name, u=u_values, alpha=alpha_values)
+            except Exception as e:
+                failed = True
+                self.errors.put(repr(e))
+
+    def check(self):
+        """Raise the error of the writer process in the solver process"""
+        if not self.errors.empty():
+            raise RuntimeError("The field writer failed: %s" %self.errors.get())
+
+    def send(self, item):
+        """Put the item in the queue, the writer process is checked while the queue is full"""
+        while True:
+            self.check()
+            if not self.process.is_alive():
+                raise RuntimeError("The field writer process has stopped")
+            try:
+                self.queue.put(item, timeout=output_timeout)
+                return
+            except queue.Full:
+                pass
+
+    def put(self, u_out, alpha_out, n, peak):
+        """Send the dof values of the fields, waits while the queue is full"""
+        file_name = "%s/step_%d%s.npz" %(snapshot_dir, n, '_peak' if peak else '')
+        self.send((file_name, u_out.vector().get_local(), alpha_out.vector().get_local()))
+        self.snapshots.append((file_name, n, peak))
+
+    def close(self):
+        """Save the pending snapshots, stop the writer process and write the output files from the saved arrays"""
+        if self.process.is_alive():
+            self.send(None)
+            self.process.join()
+        self.check()
+        u_w, alpha_w = Function(V_u), Function(V_alpha)
+        u_w.rename('displacement','displacement')
+        alpha_w.rename('damage','damage')
+        for (file_name, n, peak) in self.snapshots:
+            data = np.load(file_name)
+            u_w.vector().set_local(data['u'])
+            u_w.vector().apply('insert')
+            alpha_w.vector().set_local(data['alpha'])
+            alpha_w.vector().apply('insert')
+            write_snapshot(u_w, alpha_w, n, peak)
+        shutil.rmtree(snapshot_dir)
+
+# the parallel runs write in the solver process, a fork is not safe next to the other MPI processes
+field_writer = FieldWriter(output_queue_size) if output_async and MPI.size(mesh.mpi_comm()) == 1 else None
+
+def dump_fields(u_out, alpha_out, n, peak=False):
+    """Write the fields of the load step n, or send them to the writer process"""
+    t_start = time.time()
+    if field_writer is not None:
+        field_writer.put(u_out, alpha_out, n, peak)
+    else:
+        write_snapshot(u_out, alpha_out, n, peak)
+    solver_stats['field_outputs'] += 1
+    solver_stats['output_time'] += time.time() - t_start
+
+def close_output():
+    """Flush the pending writes and close the output files, also at the exit on errors"""
+    if output_state.get('closed'):
+        return
+    output_state['closed'] = True
+    try:
+        if field_writer is not None:
+            field_writer.close()
+    finally:
+        force_log.close()
+        if output_format == 'xdmf':
+            file_results.close()
+            file_peak.close()
+
+atexit.register(close_output)
+
+def output_fields(n):
+    """Write the fields of the load step n when asked by the output scheduler"""
+    force, disp = abs(forces[n+1,1]), abs(forces[n+1,0])
+    if output_peak:
+        if force > output_state['peak']:
+            output_state.update({'peak': force, 'peak_step': n, 'peak_written': False})     # candidate peak, kept until the load drops
+            u_peak.assign(u)
+            alpha_peak.assign(alpha)
+        elif not output_state['peak_written'] and force < (1. - output_peak_drop)*output_state['peak']:
+            dump_fields(u_peak, alpha_peak, output_state['peak_step'], peak=True)
+            output_state['peak_written'] = True
+    write = output_every > 0 and n % output_every == 0
+    if not write and output_dalpha > 0.:
+        write = (alpha.vector() - output_state['alpha'].vector()).norm('linf') > output_dalpha
+    if not write:
+        write = any(output_state['disp'] < level <= disp for level in output_displacements)
+    output_state['disp'] = disp
+    if write:
+        dump_fields(u, alpha, n)
+        output_state['alpha'].assign(alpha)
+
 def postprocessing():  
-    forces[n+1] = np.array([u(470.,250.)[1],assemble(sigma(u,alpha)[1,1]*thickness*ds(1))])
+    forces[n+1] = load_displacement()
     # Dump solution to file
-    if n%25 == 0:
-        file_alpha << (alpha,n)                        # Phase field
-        file_u << (u,n)                                # Displacement field
-    np.savetxt(savedir+'/forces.txt', forces)          # record force displacement data
+    output_fields(n)                                   # Phase field and displacement field
+    force_log.write(np.concatenate((forces[n+1], [n+1, iterations, alpha.vector().max(), assemble(elastic_energy), assemble(dissipated_energy)])))    # record force displacement data
         
 
+# Parameters of the predictor at the start of each load step
+predictor = 'none'                    # 'none' to start from the last converged state, 'extrapolation' or 'tangent' (last Jacobian)
+predictor_order = 2                   # number of converged steps of the extrapolation (2 linear, 3 quadratic)
+predictor_alpha = False               # True to extrapolate also the phase field, clipped to [lb, ub]
+predictor_hist = []                   # applied displacement, u and alpha of the last converged steps
+u_pred = Function(V_u)                # predicted displacement, to measure the savings
+
+def applied_displacement():
+    """Current value of the applied displacement"""
+    return u_R(0., 0.)
+
+def lagrange_weights(t_hist, t):
+    """Weights of the Lagrange extrapolation to t from the values at t_hist"""
+    return [np.prod([(t - t_j)/(t_i - t_j) for j, t_j in enumerate(t_hist) if j != i]) for i, t_i in enumerate(t_hist)]
+
+def tangent_predictor():
+    """Displacement predictor with the factorisation of the last Jacobian, one back substitution"""
+    for bc_i in bc_disp:
+        bc_i.apply(u.vector())                                         # new boundary values
+    b_pred, du_pred = PETScVector(), u.vector().copy()
+    problem_u.F(b_pred, u.vector())
+    solver_u.linear_solver().solve(du_pred, b_pred)
+    u.vector().axpy(-1.0, du_pred)
+
+def predict_state():
+    """Predictor of (u, alpha) for the current load step from the last converged steps"""
+    if predictor != 'none' and predictor_hist:
+        hist = predictor_hist[-predictor_order:]
+        weights = lagrange_weights([h[0] for h in hist], applied_displacement())
+        if predictor == 'tangent' and u_problem_type == 'nonlinear' and solver_stats['factorization_u'] > 0:
+            tangent_predictor()
+        else:
+            u.vector()[:] = sum(l_i*h[1] for l_i, h in zip(weights, hist))
+        if predictor_alpha:
+            alpha.vector()[:] = np.clip(sum(l_i*h[2] for l_i, h in zip(weights, hist)), lb.vector().get_local(), ub.vector().get_local())
+    u_pred.assign(u)
+
+def store_converged_state(iterations):
+    """Store the converged step for the predictor and the statistics of the savings"""
+    if predictor_hist:
+        dist_prev = np.linalg.norm(u.vector().get_local() - predictor_hist[-1][1])           # start from the last converged step
+        dist_pred = (u.vector() - u_pred.vector()).norm('l2')                                # start from the predictor
+        if dist_prev > 0.:
+            solver_stats['predictor_gain'] += dist_pred/dist_prev
+    predictor_hist.append((applied_displacement(), u.vector().get_local(), alpha.vector().get_local()))
+    del predictor_hist[:-3]
+    solver_stats['steps'] += 1
+    solver_stats['staggered'] += iterations
+
+# Parameters of the elastic stage before the onset of damage
+elastic_shortcut = False              # True to scale a single undamaged elastic solution until damage can start
+elastic_onset_margin = 0.98           # fraction of the onset load (squared) up to which the elastic solution is scaled
+elastic_state = {'active': True, 't_1': None, 'u_1': None, 'ratio': None}
+
+def elastic_step():
+    """Scaled elastic solution if no node can damage at the current load, False from the onset of damage on"""
+    t = applied_displacement()
+    if elastic_state['t_1'] is None:
+        if u_problem_type == 'linear':                                 # elastic solution at the first load step, alpha = lb = 0
+            solve_displacement_linear()
+        else:
+            solve_displacement()
+        g_el = assemble(derivative(elastic_energy, alpha, beta)).get_local()      # scales with the square of the load
+        g_d = assemble(derivative(dissipated_energy, alpha, beta)).get_local()    # independent of the load
+        drive = np.logical_and(g_el < 0., ub.vector().get_local() > lb.vector().get_local())
+        elastic_state['t_1'], elastic_state['u_1'] = t, u.vector().get_local()
+        elastic_state['ratio'] = np.min(g_d[drive]/(-g_el[drive])) if np.any(drive) else np.inf    # (t/t_1)**2 at the onset
+        print("Onset of damage at an applied displacement of %g" %(t*np.sqrt(elastic_state['ratio'])))
+    s = t/elastic_state['t_1']
+    if s <= 0. or s*s >= elastic_onset_margin*elastic_state['ratio']:
+        elastic_state['active'] = False
+        return False
+    u.vector()[:] = s*elastic_state['u_1']                             # the elastic energy is homogeneous of degree 2 in u
+    solver_stats['elastic_steps'] += 1
+    return True
+
+# Parameters of the adaptive load step controller, the increments are multiples of the base increment disp_step
+dt_init = 1.                          # initial increment
+dt_min, dt_max = 0.25, 50.            # bounds of the increment
+step_grow, step_shrink = 1.5, 0.5     # growth and reduction factors of the increment
+target_iter = {'staggered': 10, 'monolithic': 8}       # staggered or Newton iterations above which the increment is reduced
+max_iter_step = {'staggered': 50, 'monolithic': 25}     # staggered or Newton iterations above which the load step is rejected
+max_dalpha = 0.2                      # maximum increment of alpha_max in a load step
+max_force_drop = 0.05                 # maximum force drop in a load step, relative to the peak force
+
+def load_step_control(iterations, dalpha, force_drop, dt):
+    """Acceptance of the load step and increment of the next one"""
+    if dt > dt_min and (iterations > max_iter_step[solver_scheme] or dalpha > max_dalpha or force_drop > max_force_drop):
+        return (False, max(dt_min, step_shrink*dt))                   # reject and roll back
+    if iterations > target_iter[solver_scheme] or dalpha > 0.5*max_dalpha or force_drop > 0.5*max_force_drop:
+        return (True, max(dt_min, step_shrink*dt))
+    if iterations <= target_iter[solver_scheme]/2 and dalpha < 0.1*max_dalpha and force_drop <= 0.:
+        return (True, min(dt_max, step_grow*dt))                      # elastic response
+    return (True, dt)
+
 # Execution of the loading steps
-for n in range(num_steps):
-    u_R.n = n
+if load_control == 'adaptive':
+    u_R.disp_A, u_R.disp_app, u_R.B = 0., disp_step, 0.
+    t, t_end, dt = 0., total_disp/disp_step, dt_init          # pseudo time in units of the base increment
+    u_conv, alpha_conv = Function(V_u), Function(V_alpha)           # last converged state to roll back rejected steps
+    lambda_conv = Function(V_alpha)                                 # multiplier of the augmented Lagrangian at the start of the step
+n = 0
+while n < num_steps:                                                # num_steps also bounds the adaptive load steps
+    if load_control == 'adaptive':
+        if t >= t_end - 1.e-8:
+            break
+        dt = min(dt, t_end - t)
+        u_R.n = t + dt - 1.
+        u_conv.assign(u)
+        alpha_conv.assign(alpha)
+        if irreversibility == 'augmented_lagrangian':
+            lambda_conv.assign(lambda_ir)
+    else:
+        u_R.n = n
+    predict_state()                                                 # start of the load step
     # solve alternate minimization
-    alternate_minimization(u,alpha,maxiter=20000)                   # call solver function
+    maxiter = max_iter_step[solver_scheme] + 2 if load_control == 'adaptive' and dt > dt_min else None
+    if elastic_shortcut and elastic_state['active'] and elastic_step():
+        iterations = 0                                              # undamaged elastic step
+    elif solver_scheme == 'monolithic':
+        (converged, iterations) = monolithic_minimization(u,alpha,maxiter=maxiter or 500)    # call coupled solver function
+        if not converged:
+            if load_control != 'adaptive' or dt <= dt_min:
+                raise RuntimeError("The monolithic solver did not converge in load step %d" %n)
+            iterations = max_iter_step[solver_scheme] + 1           # rejected by the load step controller
+    else:
+        iterations = alternate_minimization(u,alpha,maxiter=maxiter or 20000)[1] - 1     # call solver function
+    if load_control == 'adaptive':
+        force_prev, force_peak = forces[n, 1], np.max(forces[:n+1, 1])
+        force_drop = (force_prev - load_displacement()[1])/force_peak if force_peak > 0. else 0.
+        (accepted, dt_next) = load_step_control(iterations, alpha.vector().max() - alpha_conv.vector().max(), force_drop, dt)
+        if not accepted:
+            u.assign(u_conv)
+            alpha.assign(alpha_conv)
+            if irreversibility == 'augmented_lagrangian':
+                lambda_ir.assign(lambda_conv)
+            print("Load step rejected, increment reduced to %g" %(dt_next*disp_step))
+            dt = dt_next
+            continue
+        t, dt = t + dt, dt_next
+    store_converged_state(iterations)
     postprocessing()                                                # call postprocessing function
     print("\nEnd of timestep %d with load %g"%(n, u(470.,250.)[1])) # print completion of load step in terminal
     print("-----------------------------------------")
 
+    if irreversibility in ['penalty', 'augmented_lagrangian']:
+        alpha.vector()[:] = np.maximum(alpha.vector().get_local(), lb.vector().get_local())    # remove the admissible violation
     lb.vector()[:] = alpha.vector()                                # updating the lower bound to account for the irreversibility
+    if freeze_cracked:
+        freeze_cracked_nodes()
+    if irreversibility == 'history':
+        H_conv.assign(H)                                            # updating the history field
+    if irreversibility == 'augmented_lagrangian':
+        lambda_ir.vector().zero()                                   # new multiplier for the new lower bound
+    n = n + 1
 
 # Print time taken to complete the simulation  
 comp_end = time.time()
+close_output()
+print_solver_stats()
 print(f"Runtime of the program is {comp_end - comp_start} sec")
 
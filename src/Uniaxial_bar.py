@@ -26,7 +26,13 @@ import matplotlib.pyplot as plt    # Plotting Library
 from ufl import nabla_div
 import numpy as np
 from ufl import replace
+from ufl.algorithms import expand_derivatives, extract_coefficients
+from ufl.algorithms.estimate_degrees import estimate_total_polynomial_degree
+import ufl, FIAT
 import sys, os, shutil, math
+import time
+import multiprocessing, queue, atexit
+from petsc4py import PETSc
 
 # Define Material Properties
 E = 30000.0                           # Young's Modulus
@@ -132,24 +138,237 @@ total_energy = elastic_energy + dissipated_energy
 E_u = derivative(total_energy,u,v)
 Jd = derivative(E_u, u, du)
 
+# Parameters for the phase field subproblem
+damage_energy_cache = False           # True to evaluate the positive elastic energy density once per staggered iteration
+psi_degree = 2                        # quadrature degree of the stored elastic energy density
+irreversibility = 'bounds'            # 'bounds' for the TAO bound constraints, 'history' for the history field H = max(psi) and a linear solve (AT2-type models),
+                                      # 'penalty' or 'augmented_lagrangian' for a penalty term and a Newton solve
+
+# Elastic energy density (no strain decomposition) stored at the quadrature points, as u is frozen during the phase field solution
+dx_q = dx(metadata={'quadrature_degree': psi_degree, 'quadrature_scheme': 'default'})
+V_q = FunctionSpace(mesh, FiniteElement('Quadrature', mesh.ufl_cell(), psi_degree, quad_scheme='default'))
+psi_plus = Function(V_q)
+if damage_energy_cache or irreversibility == 'history':
+    psi_solver = LocalSolver(TrialFunction(V_q)*TestFunction(V_q)*dx_q, 0.5*inner(sigma_0(u), eps(u))*TestFunction(V_q)*dx_q)    # pointwise evaluation of the energy density
+    psi_solver.factorize()
+if damage_energy_cache:
+    damage_elastic_energy = a(alpha)*psi_plus*dx_q
+else:
+    damage_elastic_energy = elastic_energy
+damage_energy = damage_elastic_energy + dissipated_energy                 # energy of the phase field subproblem
+
+def update_energy_density():
+    """Evaluate the elastic energy density at the quadrature points for the current displacement"""
+    psi_solver.solve_local_rhs(psi_plus)
+
 # First and second directional derivative wrt phase field
-E_alpha = derivative(total_energy,alpha,beta)
+E_alpha = derivative(damage_energy,alpha,beta)
 E_alpha_alpha = derivative(E_alpha,alpha,dalpha)
 
+# Parameters for the dissipation part of the phase field subproblem
+dissipation_preassembled = True       # True to assemble the dissipation operators once, valid if w(alpha) is at most quadratic
+
+if dissipation_preassembled and w(3.) - 3*w(2.) + 3*w(1.) - w(0.) != 0:            # third finite difference of w(alpha)
+    print('w(alpha) is not quadratic, the dissipation operators are assembled at every call')
+    dissipation_preassembled = False
+if dissipation_preassembled:
+    alpha_zero = Function(V_alpha)
+    E_diss_alpha = derivative(dissipated_energy,alpha,beta)
+    K_diss = assemble(derivative(E_diss_alpha,alpha,dalpha))                        # constant Hessian of the dissipation
+    b_diss = assemble(replace(E_diss_alpha, {alpha: alpha_zero}))                   # constant part of the gradient of the dissipation
+    Kx_diss = b_diss.copy()
+    E_el_alpha = derivative(damage_elastic_energy,alpha,beta)                         # alpha-dependent elastic coupling
+    E_el_alpha_alpha = derivative(E_el_alpha,alpha,dalpha)
+
+# Quadrature degree of the nonlinear forms, None to keep the degree estimated by UFL
+quadrature_degree = {'E_u': None, 'Jd': None, 'energy': None, 'E_alpha': None, 'E_alpha_alpha': None}
+
+def on_quadrature_space(itg):
+    """True if the integrand holds a function of a quadrature space, the degree of the integral is then fixed by that space"""
+    return any(c.ufl_element().family() == 'Quadrature' for c in extract_coefficients(itg.integrand()))
+
+def with_quadrature_degree(form, degree):
+    """Form with the given quadrature degree on all its integrals, except the integrals of the stored energy density (psi_degree)"""
+    if degree is None:
+        return form
+    return ufl.Form([itg if on_quadrature_space(itg) else itg.reconstruct(metadata=dict(itg.metadata(), quadrature_degree=degree))
+                     for itg in form.integrals()])
+
+def report_quadrature(name, form):
+    """Print the quadrature degree and the number of quadrature points per cell of each integral of the form"""
+    for itg in expand_derivatives(form).integrals():
+        degree = itg.metadata().get('quadrature_degree', estimate_total_polynomial_degree(itg.integrand()))
+        num_points = len(FIAT.create_quadrature(FIAT.ufc_simplex(mesh.topology().dim()), degree).get_points())
+        print("%-14s quadrature degree %3d, %5d points per cell" %(name, degree, num_points))
+
+E_u = with_quadrature_degree(E_u, quadrature_degree['E_u'])
+Jd = with_quadrature_degree(Jd, quadrature_degree['Jd'])
+damage_energy = with_quadrature_degree(damage_energy, quadrature_degree['energy'])
+damage_elastic_energy = with_quadrature_degree(damage_elastic_energy, quadrature_degree['energy'])
+E_alpha = with_quadrature_degree(E_alpha, quadrature_degree['E_alpha'])
+E_alpha_alpha = with_quadrature_degree(E_alpha_alpha, quadrature_degree['E_alpha_alpha'])
+if dissipation_preassembled:
+    E_el_alpha = with_quadrature_degree(E_el_alpha, quadrature_degree['E_alpha'])
+    E_el_alpha_alpha = with_quadrature_degree(E_el_alpha_alpha, quadrature_degree['E_alpha_alpha'])
+for (name, form) in [('E_u', E_u), ('Jd', Jd), ('energy', damage_energy), ('E_alpha', E_alpha), ('E_alpha_alpha', E_alpha_alpha)]:
+    report_quadrature(name, form)
+
 # define loading steps
 num_steps = 50
 disp_app = 0.12/num_steps
+load_control = 'fixed'               # 'fixed' for the load steps defined here, 'adaptive' for the automatic step size controller,
+                                     # 'dissipation' for the dissipation-based path following of the staggered scheme, which traces snap-back branches
+disp_step = disp_app                 # base increment of the adaptive load step controller
 
 u_R = Expression(('disp_app*(n+1)'),disp_app = disp_app, n=0., degree=0)          # Define loading as expression so that it can be updated for next step
 bcr = DirichletBC(V_u, u_R, right)                                                # define boundary condition
 bc_disp = [bcl, bcr]                                                              # Apply boundary conditions
 
-# Define solver parameters for the displacement field
-problem_u = NonlinearVariationalProblem(E_u, u, bc_disp, Jd)
-solver_u = NonlinearVariationalSolver(problem_u)
+# Parameters of the dissipation-based path following, the load factor is the displacement of the right end
+dissipation_step = Gc/50.             # energy dissipated in a load step
+path_end_stiffness = 1.e-3            # the bar is broken when its stiffness drops below this fraction of the initial one
+path_state = {'lam': 0., 'k': 1., 'broken': False}     # load factor and stiffness of the last converged step
+path_max_steps = 2000                 # bound of the load steps of the path following, the run ends when the bar is broken
+if load_control == 'dissipation':
+    num_steps = path_max_steps
+
+def path_following_load(iter):
+    """Scale the displacement to the load factor that dissipates dissipation_step in the load step (secant constraint of Gutierrez)"""
+    k = assemble(sigma(u,alpha)[0]*ds(1))                                          # reaction of the unit displacement
+    if iter == 1:
+        path_state['k'] = k                                                        # alpha is still the converged one
+    lam_0, k_0 = path_state['lam'], path_state['k']
+    lam = lam_0 + disp_step                                                        # displacement control in the elastic stage
+    if k_0 - k > 1.e-12*k_0 and lam_0 > 0.:
+        lam = min(lam, 2.*dissipation_step/(lam_0*(k_0 - k)))                      # 0.5*lam_0*lam*(k_0 - k) = dissipation_step
+    u.vector()[:] *= lam                                                           # the displacement is linear in the load factor
+    u_R.disp_app = lam
+
+# Define class and solver parameters for the displacement field
+u_reuse_factorization = True          # True to keep one factorisation and reuse its symbolic analysis, False to redo it at every Newton iteration
+
+# LU factorisation with MUMPS through a persistent PETSc linear solver
+PETScOptions.set("u_ksp_type", "preonly")
+PETScOptions.set("u_pc_type", "lu")
+PETScOptions.set("u_pc_factor_mat_solver_type", "mumps")
+
+# Statistics of the solvers reported at the end of the run
+solver_stats = {'time_u': 0., 'assembly_u': 0., 'linear_solve_u': 0., 'newton_u': 0, 'factorization_u': 0, 'steps': 0, 'staggered': 0, 'predictor_gain': 0., 'elastic_steps': 0, 'tao_alpha': 0, 'tao_skipped': 0, 'history_solves': 0, 'krylov_alpha': 0, 'penalty_solves': 0, 'newton_alpha': 0, 'violation_ir': 0., 'violation_exceeded': 0, 'field_outputs': 0, 'output_time': 0.}
+PETSc.Log.begin()                     # the PETSc log counts the factorisations actually performed
+stage_u = PETSc.Log.Stage("displacement")      # displacement solves, apart from the phase field solves
+
+def factorization_log():
+    """Count and time of the symbolic and numerical LU factorisations of the displacement solves, from the PETSc log"""
+    return [(int(info['count']), info['time']) for info in [PETSc.Log.Event(name).getPerfInfo(stage_u.id) for name in ['MatLUFactorSym', 'MatLUFactorNum']]]
+
+class DisplacementProblem(NonlinearProblem):
+
+    def __init__(self):
+        NonlinearProblem.__init__(self)
+        self.assembler = SystemAssembler(Jd, E_u, bc_disp)
+
+    def F(self, b, x):
+        """Residual (first derivative)"""
+        t_start = time.time()
+        self.assembler.assemble(b, x)
+        solver_stats['assembly_u'] += time.time() - t_start
+
+    def J(self, A, x):
+        """Jacobian (second derivative)"""
+        t_start = time.time()
+        self.assembler.assemble(A)
+        solver_stats['assembly_u'] += time.time() - t_start
+
+class DisplacementSolver(NewtonSolver):
+
+    def __init__(self):
+        NewtonSolver.__init__(self, mesh.mpi_comm(), PETScKrylovSolver(), PETScFactory.instance())
+        self.linear_solver().set_options_prefix("u_")
+        self.linear_solver().set_from_options()
+
+    def solver_setup(self, A, P, problem, iteration):
+        """Set the Jacobian on the persistent linear solver, PETSc only refactors numerically if the sparsity is unchanged"""
+        if not u_reuse_factorization:
+            self.linear_solver().ksp().reset()                    # drop the factorisation and its symbolic analysis
+        self.linear_solver().set_operator(A)
+        solver_stats['factorization_u'] += 1
+        self.t_solve = time.time()
+
+    def update_solution(self, x, dx, relaxation_parameter, problem, iteration):
+        """Update of the displacement with the Newton increment"""
+        solver_stats['linear_solve_u'] += time.time() - self.t_solve
+        x.axpy(-relaxation_parameter, dx)
+
+problem_u = DisplacementProblem()
+solver_u = DisplacementSolver()
 prm = solver_u.parameters
 
-prm["newton_solver"]["linear_solver"] = 'mumps'
+def solve_displacement():
+    """Newton solution of the displacement field"""
+    t_start = time.time()
+    stage_u.push()
+    (newton_iter, converged) = solver_u.solve(problem_u, u.vector())
+    stage_u.pop()
+    solver_stats['newton_u'] += newton_iter
+    solver_stats['time_u'] += time.time() - t_start
+
+def print_solver_stats():
+    """Print the time breakdown of the displacement solver"""
+    print("Displacement solver: %.4g sec in total, %.4g sec assembly, %.4g sec linear solves" %(solver_stats['time_u'], solver_stats['assembly_u'], solver_stats['linear_solve_u']))
+    print("Newton iterations: %d, operator updates: %d" %(solver_stats['newton_u'], solver_stats['factorization_u']))
+    ((n_sym, t_sym), (n_num, t_num)) = factorization_log()
+    if n_num > 0:
+        print("LU factorisations: %d symbolic in %.4g sec, %d numerical in %.4g sec" %(n_sym, t_sym, n_num, t_num))
+        if u_reuse_factorization and n_sym > 0:
+            print("Without reuse of the symbolic analysis: %d symbolic factorisations, %.4g sec more at the measured average" %(n_num, (n_num - n_sym)*t_sym/n_sym))
+    if solver_stats['factorization_u'] > 0:
+        print("Average linear solve: %.4g sec" %(solver_stats['linear_solve_u']/solver_stats['factorization_u']))
+    if solver_stats['steps'] > 1 and load_control != 'dissipation':     # no predictor in the path following
+        print("Predictor '%s': average distance to the converged displacement %.3g of the previous step, %.3g Newton and %.3g staggered iterations per step"
+              %(predictor, solver_stats['predictor_gain']/(solver_stats['steps'] - 1), solver_stats['newton_u']/solver_stats['steps'], solver_stats['staggered']/solver_stats['steps']))
+    if elastic_shortcut:
+        print("Elastic steps solved by scaling: %d" %(solver_stats['elastic_steps']))
+    if tao_skip_check:
+        print("Phase field solves: %d, skipped by the driving force check: %d" %(solver_stats['tao_alpha'], solver_stats['tao_skipped']))
+    if irreversibility == 'history':
+        print("Phase field linear solves with the history field: %d, Krylov iterations: %d" %(solver_stats['history_solves'], solver_stats['krylov_alpha']))
+    if irreversibility in ['penalty', 'augmented_lagrangian']:
+        print("Phase field Newton solves (%s): %d, Newton iterations: %d" %(irreversibility, solver_stats['penalty_solves'], solver_stats['newton_alpha']))
+        print("Maximum violation of alpha >= lb: %.3g, solves above penalty_tol = %g: %d" %(solver_stats['violation_ir'], penalty_tol, solver_stats['violation_exceeded']))
+    print("Field outputs: %d in %.4g sec" %(solver_stats['field_outputs'], solver_stats['output_time']))
+
+# Parameters for the linear displacement subproblem
+u_problem_type = 'auto'               # 'auto' to detect it from Jd, 'linear' or 'nonlinear' to declare it
+
+if u_problem_type == 'auto':          # E_u is linear in u if Jd does not depend on u
+    u_problem_type = 'nonlinear' if u in extract_coefficients(expand_derivatives(Jd)) else 'linear'
+if load_control == 'dissipation' and u_problem_type != 'linear':
+    raise ValueError("load_control = 'dissipation' scales the displacement with the load factor, the displacement problem must be linear")
+if u_problem_type == 'linear':
+    L_u = Constant(0.0)*v*dx                                  # no body force acts on the bar
+    assembler_u = SystemAssembler(Jd, L_u, bc_disp)
+    A_u, b_u = PETScMatrix(), PETScVector()
+    solver_u_lin = PETScLUSolver(mesh.mpi_comm(), "mumps")
+    alpha_u = Function(V_alpha)                               # phase field of the current factorisation
+
+def solve_displacement_linear():
+    """Direct solution of the linear displacement problem, the factorisation is reused while alpha is unchanged"""
+    t_start = time.time()
+    stage_u.push()
+    if A_u.empty() or (alpha.vector() - alpha_u.vector()).norm('linf') > 0.0:
+        assembler_u.assemble(A_u)
+        if not u_reuse_factorization:
+            solver_u_lin.ksp().reset()                        # drop the factorisation and its symbolic analysis
+        solver_u_lin.set_operator(A_u)
+        alpha_u.assign(alpha)
+        solver_stats['factorization_u'] += 1
+    assembler_u.assemble(b_u)
+    t_solve = time.time()
+    solver_u_lin.solve(u.vector(), b_u)
+    stage_u.pop()
+    solver_stats['assembly_u'] += t_solve - t_start
+    solver_stats['linear_solve_u'] += time.time() - t_solve
+    solver_stats['time_u'] += time.time() - t_start
 
 
 # Define class and solver parameters for the phase field
@@ -158,17 +377,30 @@ class DamageProblem(OptimisationProblem):
     def f(self, x):
         """Function to be minimized"""
         alpha.vector()[:] = x
-        return assemble(total_energy)
+        if dissipation_preassembled:
+            K_diss.mult(x, Kx_diss)
+            return assemble(damage_elastic_energy) + b_diss.inner(x) + 0.5*Kx_diss.inner(x)
+        return assemble(damage_energy)
 
     def F(self, b, x):
         """Gradient (first derivative)"""
         alpha.vector()[:] = x
-        assemble(E_alpha, b)
+        if dissipation_preassembled:
+            assemble(E_el_alpha, b)
+            K_diss.mult(x, Kx_diss)
+            b.axpy(1.0, b_diss)
+            b.axpy(1.0, Kx_diss)
+        else:
+            assemble(E_alpha, b)
 
     def J(self, A, x):
         """Hessian (second derivative)"""
         alpha.vector()[:] = x
-        assemble(E_alpha_alpha, A)
+        if dissipation_preassembled:
+            assemble(E_el_alpha_alpha, A)
+            A.axpy(1.0, K_diss, True)                     # same sparsity pattern
+        else:
+            assemble(E_alpha_alpha, A)
 
 
 solver_alpha_tao = PETScTAOSolver()
@@ -176,60 +408,607 @@ solver_alpha_tao.parameters.update({"method": "tron","linear_solver" : "umfpack"
                                     "line_search": "gpcg", "report": False, "maximum_iterations": 1000, "gradient_absolute_tol": 1.0e-07, "gradient_relative_tol": 1.0e-07})
 
 # Boundary conditions for phase field
+bc_alpha = []
 bc = DirichletBC(V_alpha, Constant(0.0), left)         # define boundary condition
 bc.apply(lb.vector())                                  # Apply boundary condition on lower limit
 bc.apply(ub.vector())                                  # Apply boundary condition on upper limit
+bc_alpha.append(bc)
 
 bc = DirichletBC(V_alpha, Constant(0.0), right)        # define boundary condition
 bc.apply(lb.vector())                                  # Apply boundary condition on lower limit
 bc.apply(ub.vector())                                  # Apply boundary condition on upper limit
-
-# Function to define the staggered solving procedure                               
+bc_alpha.append(bc)
+
+# History field of the irreversibility, the phase field subproblem is then unconstrained
+history_pc_rebuild = 10               # solves between two rebuilds of the preconditioner of the phase field
+
+if irreversibility == 'history':
+    H, H_conv = Function(V_q), Function(V_q)                    # history field of the current and of the last converged step
+    history_energy = a(alpha)*H*dx_q + dissipated_energy
+    E_alpha_H = derivative(history_energy, alpha, beta)
+    E_alpha_alpha_H = derivative(E_alpha_H, alpha, dalpha)
+    if alpha in extract_coefficients(expand_derivatives(E_alpha_alpha_H)):
+        raise ValueError("irreversibility = 'history' needs a phase field subproblem quadratic in alpha (AT2-type w and a), "
+                         "the history energy of the other models is not bounded below")
+    A_H, b_H, dalpha_H = PETScMatrix(), PETScVector(), alpha.vector().copy()
+    PETScOptions.set("alpha_ksp_type", "cg")                    # the Hessian of AT2 is symmetric positive definite
+    PETScOptions.set("alpha_ksp_rtol", 1.e-10)
+    PETScOptions.set("alpha_pc_type", "hypre")
+    PETScOptions.set("alpha_pc_hypre_type", "boomeramg")
+    solver_alpha_lin = PETScKrylovSolver()
+    solver_alpha_lin.set_options_prefix("alpha_")
+    solver_alpha_lin.set_from_options()
+
+def solve_phase_field_history():
+    """Phase field driven by the history field, one linear solve as the subproblem is quadratic"""
+    psi_solver.solve_local_rhs(psi_plus)
+    H.vector()[:] = np.maximum(H_conv.vector().get_local(), psi_plus.vector().get_local())
+    assemble_system(E_alpha_alpha_H, E_alpha_H, bc_alpha, A_tensor=A_H, b_tensor=b_H)
+    solver_alpha_lin.set_reuse_preconditioner(solver_stats['history_solves'] % history_pc_rebuild != 0)
+    solver_alpha_lin.set_operator(A_H)
+    solver_alpha_lin.solve(dalpha_H, b_H)
+    alpha.vector().axpy(-1.0, dalpha_H)
+    solver_stats['history_solves'] += 1
+    solver_stats['krylov_alpha'] += solver_alpha_lin.ksp().getIterationNumber()
+    alpha.vector()[:] = np.clip(alpha.vector().get_local(), 0., 1.)        # round-off of the Krylov solve
+
+# Penalty or augmented Lagrangian irreversibility, the phase field subproblem is then solved by Newton without bounds
+penalty_tol = 0.01                    # admissible violation of alpha >= lb, sets the penalty parameter (Gerasimov and De Lorenzis 2019)
+
+if irreversibility in ['penalty', 'augmented_lagrangian']:
+    w_prime_0 = (w(1.e-8) - w(0.))/1.e-8
+    if w_prime_0 > 0.:
+        gamma_ir = Gc*w_prime_0/(float(c_w)*ell*penalty_tol)             # violation penalty_tol of the homogeneous solution without driving force
+    else:
+        gamma_ir = Gc/ell*(1./penalty_tol**2 - 1.)                       # AT2
+    gamma_ir = max(gamma_ir, Gc*ell/(float(c_w)*mesh.hmin()**2))         # not weaker than the gradient term on the smallest cell
+    lambda_ir = Function(V_alpha)                                        # multiplier of the augmented Lagrangian, zero for the penalty
+    g_ir = lambda_ir + gamma_ir*(alpha - lb)
+    penalty_energy = 1./(2.*gamma_ir)*((0.5*(g_ir - abs(g_ir)))**2 - lambda_ir**2)*dx
+    E_alpha_P = derivative(damage_energy + penalty_energy, alpha, beta)
+    E_alpha_alpha_P = derivative(E_alpha_P, alpha, dalpha)
+    problem_alpha_P = NonlinearVariationalProblem(E_alpha_P, alpha, bc_alpha, E_alpha_alpha_P)
+    solver_alpha_P = NonlinearVariationalSolver(problem_alpha_P)
+    solver_alpha_P.parameters.update({"nonlinear_solver": "snes",
+                                      "snes_solver": {"method": "newtonls", "linear_solver": "mumps", "line_search": "bt",
+                                                      "maximum_iterations": 100, "absolute_tolerance": 1.e-8, "relative_tolerance": 1.e-8,
+                                                      "report": False, "error_on_nonconvergence": False}})
+
+def solve_phase_field_penalty():
+    """Phase field with the penalised irreversibility, the multiplier of the augmented Lagrangian is updated afterwards"""
+    (iter, converged) = solver_alpha_P.solve()
+    if not converged:
+        raise RuntimeError("The phase field Newton solver (%s) did not converge in %d iterations" %(irreversibility, iter))
+    alpha.vector()[:] = np.minimum(alpha.vector().get_local(), ub.vector().get_local())
+    violation = (lb.vector() - alpha.vector()).max()                # violation of alpha >= lb
+    solver_stats['violation_ir'] = max(solver_stats['violation_ir'], violation)
+    if violation > penalty_tol:
+        solver_stats['violation_exceeded'] += 1
+    if irreversibility == 'augmented_lagrangian':
+        lambda_ir.vector()[:] = np.minimum(0., lambda_ir.vector().get_local() + gamma_ir*(alpha.vector().get_local() - lb.vector().get_local()))
+    solver_stats['penalty_solves'] += 1
+    solver_stats['newton_alpha'] += iter
+
+# Parameters of the check of the damage driving force before the phase field solution
+tao_skip_check = False                # True to skip the TAO solve if no node can damage from the lower bound
+
+def damage_inactive():
+    """True if the projected gradient of the energy at alpha = lb vanishes, alpha = lb is then the solution"""
+    x, g = lb.vector().copy(), lb.vector().copy()
+    alpha_iterate = alpha.vector().copy()
+    DamageProblem().F(g, x)                                        # sets alpha = lb
+    free = ub.vector().get_local() > lb.vector().get_local()
+    g_proj = np.minimum(g.get_local(), 0.)[free]                   # only a negative gradient can increase alpha
+    inactive = np.linalg.norm(g_proj) <= solver_alpha_tao.parameters["gradient_absolute_tol"]
+    if not inactive:
+        alpha.vector()[:] = alpha_iterate                          # TAO starts from the current staggered iterate
+    return inactive
+
+# Parameters for the acceleration of the staggered procedure
+anderson = False                      # True to apply the Anderson acceleration on the phase field iterations
+anderson_depth = 5                    # number of previous iterations kept in the Anderson history
+anderson_safeguard = 1.0              # restart with the plain iteration if the error grows by more than this factor
+
+def anderson_mixing(x_hist, g_hist):
+    """Anderson extrapolation of the phase field from the history of the staggered iterations"""
+    f_hist = [g - x for x, g in zip(x_hist, g_hist)]                               # residuals of the fixed point map
+    dF = np.column_stack([f_hist[i+1] - f_hist[i] for i in range(len(f_hist)-1)])
+    dG = np.column_stack([g_hist[i+1] - g_hist[i] for i in range(len(g_hist)-1)])
+    gamma = np.linalg.lstsq(dF, f_hist[-1], rcond=None)[0]                       # mixing coefficients
+    return g_hist[-1] - dG.dot(gamma)
+
+# Parameters for the inexact solution of the subproblems in the staggered procedure
+inexact_solves = False                # True to adapt the tolerances of the Newton and TAO solvers to the staggered error
+inexact_gamma = 0.1                   # the nominal tolerances are loosened by inexact_gamma*err_alpha/tol
+inexact_factor_max = 100.             # maximum loosening of the nominal tolerances
+tol_nominal = {'newton_rel': prm["relative_tolerance"], 'newton_abs': prm["absolute_tolerance"],
+               'tao_abs': solver_alpha_tao.parameters["gradient_absolute_tol"], 'tao_rel': solver_alpha_tao.parameters["gradient_relative_tol"]}
+inexact_state = {'err_first': 1.}     # staggered error after the first iteration of the previous load step
+
+def set_inner_tolerances(factor):
+    """Scale the nominal tolerances of the displacement and phase field solvers by the given factor"""
+    prm["relative_tolerance"] = max(tol_nominal['newton_rel'], min(0.9, factor*tol_nominal['newton_rel']))
+    prm["absolute_tolerance"] = factor*tol_nominal['newton_abs']
+    solver_alpha_tao.parameters["gradient_absolute_tol"] = factor*tol_nominal['tao_abs']
+    solver_alpha_tao.parameters["gradient_relative_tol"] = max(tol_nominal['tao_rel'], min(0.9, factor*tol_nominal['tao_rel']))
+
+def inexact_factor(err_alpha, tol):
+    """Loosening factor of the inner tolerances (Eisenstat-Walker type forcing term), 1 close to convergence"""
+    return min(inexact_factor_max, max(1., inexact_gamma*err_alpha/tol))
+
+# Function to define the staggered solving procedure
 def alternate_minimization(u,alpha,tol=1.e-5,maxiter=1000,alpha_0=interpolate(Constant("0.0"), V_alpha)):
     # initialization
     iter = 1; err_alpha = 1
+    alpha_0.assign(alpha)                           # reference for the error, also after a rejected load step
     alpha_error = Function(V_alpha)
-    # iteration loop
-    while err_alpha>tol and iter<maxiter:
+    x_hist, g_hist = [], []                         # history of the Anderson acceleration
+    factor = inexact_factor(inexact_state['err_first'], tol) if inexact_solves else 1.
+    factor_used = 1.
+    # iteration loop, with inexact solves the last iteration has to use the nominal tolerances
+    while (err_alpha>tol or factor_used>1.) and iter<maxiter:
+        if inexact_solves:
+            set_inner_tolerances(factor)
+            factor_used = factor
         # solve elastic problem
-        solver_u.solve()
+        if load_control == 'dissipation':
+            u_R.disp_app = 1.                                          # unit displacement, scaled by the load factor afterwards
+        if u_problem_type == 'linear':
+            solve_displacement_linear()
+        else:
+            solve_displacement()
+        if load_control == 'dissipation':
+            path_following_load(iter)
         # solve phase field problem
-
-        solver_alpha_tao.solve(DamageProblem(), alpha.vector(), lb.vector(), ub.vector())# test error
+        if damage_energy_cache:
+            update_energy_density()
+        if irreversibility == 'history':
+            solve_phase_field_history()
+        elif irreversibility in ['penalty', 'augmented_lagrangian']:
+            solve_phase_field_penalty()
+        elif tao_skip_check and damage_inactive():
+            solver_stats['tao_skipped'] += 1
+        else:
+            solver_alpha_tao.solve(DamageProblem(), alpha.vector(), lb.vector(), ub.vector())
+            solver_stats['tao_alpha'] += 1
+        # test error
         alpha_error.vector()[:] = alpha.vector() - alpha_0.vector()
-        err_alpha = np.linalg.norm(alpha_error.vector().get_local(), ord = np.Inf)        
+        err_alpha_old = err_alpha
+        err_alpha = np.linalg.norm(alpha_error.vector().get_local(), ord = np.Inf)
+        if inexact_solves:
+            factor = inexact_factor(err_alpha, tol)
+            if iter == 1:
+                inexact_state['err_first'] = err_alpha
         # update iteration
+        if anderson:
+            if len(g_hist) > 1 and err_alpha > anderson_safeguard*err_alpha_old:
+                x_hist, g_hist = [], []             # safeguard: restart from the plain iteration
+            x_hist.append(alpha_0.vector().get_local())
+            g_hist.append(alpha.vector().get_local())
+            x_hist, g_hist = x_hist[-anderson_depth-1:], g_hist[-anderson_depth-1:]
+            if len(g_hist) > 1:
+                alpha.vector()[:] = np.clip(anderson_mixing(x_hist, g_hist), lb.vector().get_local(), ub.vector().get_local())
         alpha_0.assign(alpha)
         iter=iter+1
+    if inexact_solves:
+        set_inner_tolerances(1.)
     print("Iteration:  %2d, Error: %2.8g, alpha_max: %.8g" %(iter-1, err_alpha, alpha.vector().max()))
     return (err_alpha, iter)
 
+# Parameters for the monolithic solution of the coupled problem
+solver_scheme = 'staggered'           # 'staggered' for the alternate minimization, 'monolithic' for the coupled SNES VI solver
+
+if load_control == 'dissipation' and solver_scheme != 'staggered':
+    raise ValueError("load_control = 'dissipation' sets the load factor in the staggered iterations, it cannot be used with solver_scheme = '%s'" %solver_scheme)
+if solver_scheme == 'monolithic':
+    V_m = FunctionSpace(mesh, MixedElement([V_u.ufl_element(), V_alpha.ufl_element()]))  # mixed space for (u, alpha)
+    w_m, w_lb, w_ub = Function(V_m), Function(V_m), Function(V_m)
+    u_m, alpha_m = split(w_m)
+    total_energy_m = replace(total_energy, {u: u_m, alpha: alpha_m})                      # total energy of the coupled problem
+    E_m = derivative(total_energy_m, w_m, TestFunction(V_m))
+    J_m = derivative(E_m, w_m, TrialFunction(V_m))
+    bc_m = [DirichletBC(V_m.sub(0), Constant(0.0), left),
+            DirichletBC(V_m.sub(0), u_R, right)]                                          # same boundary conditions as bc_disp
+    assigner_m = FunctionAssigner(V_m, [V_u, V_alpha])                                    # (u, alpha) -> mixed function
+    assigner_u = FunctionAssigner(V_u, V_m.sub(0))                                        # mixed function -> u
+    assigner_alpha = FunctionAssigner(V_alpha, V_m.sub(1))                                # mixed function -> alpha
+    u_lb, u_ub = Function(V_u), Function(V_u)                                             # the displacement is not bounded
+    u_lb.vector()[:] = -1.e20
+    u_ub.vector()[:] = 1.e20
+    problem_m = NonlinearVariationalProblem(E_m, w_m, bc_m, J_m)
+    problem_m.set_bounds(w_lb, w_ub)                                                      # irreversibility through the bounds of the phase field
+    solver_m = NonlinearVariationalSolver(problem_m)
+    solver_m.parameters.update({"nonlinear_solver": "snes",
+                                "snes_solver": {"method": "vinewtonrsls", "linear_solver": "mumps", "line_search": "basic",
+                                                "maximum_iterations": 500, "absolute_tolerance": 1.e-6, "relative_tolerance": 1.e-6,
+                                                "report": True, "error_on_nonconvergence": False}})
+
+# Function to solve the coupled problem in one go
+def monolithic_minimization(u,alpha,maxiter=500):
+    t_start = time.time()
+    solver_m.parameters["snes_solver"]["maximum_iterations"] = maxiter
+    assigner_m.assign(w_m, [u, alpha])                  # start from the last converged state
+    assigner_m.assign(w_lb, [u_lb, lb])                 # update the bounds of the phase field
+    assigner_m.assign(w_ub, [u_ub, ub])
+    (iter, converged) = solver_m.solve()
+    assigner_u.assign(u, w_m.sub(0))
+    assigner_alpha.assign(alpha, w_m.sub(1))
+    print("Newton iterations:  %2d, converged: %s, time: %.3g sec, alpha_max: %.8g" %(iter, converged, time.time() - t_start, alpha.vector().max()))
+    return (converged, iter)
+
     
 savedir = "results/"                            # directory to export files
 if os.path.isdir(savedir):
     shutil.rmtree(savedir)
-file_alpha = File(savedir+"/alpha.pvd")         # define file name for phase field files
-file_u = File(savedir+"/u.pvd")                 # define file name for displacement field files
+output_format = 'pvd'                # 'pvd' for one .vtu file per field and step, 'xdmf' for a single XDMF/HDF5 time series of all the fields
+if output_format == 'xdmf':
+    file_results = XDMFFile(mesh.mpi_comm(), savedir+"/results.xdmf")          # parallel HDF5 output, written by all the processes
+    file_peak = XDMFFile(mesh.mpi_comm(), savedir+"/peak.xdmf")                # snapshot at the peak load, written after later steps
+    for file_xdmf in [file_results, file_peak]:
+        file_xdmf.parameters["flush_output"] = True                           # readable while the run is going
+        file_xdmf.parameters["functions_share_mesh"] = True                   # one mesh for all the fields
+        file_xdmf.parameters["rewrite_function_mesh"] = False                # the mesh is written only once
+else:
+    pvd_names = {'damage': 'alpha', 'displacement': 'u'}
+    file_pvd = dict((field, File(savedir+"/"+name+".pvd")) for (field, name) in pvd_names.items())             # files of the fields, by field name
+    file_pvd_peak = dict((field, File(savedir+"/peak_"+name+".pvd")) for (field, name) in pvd_names.items())   # snapshot at the peak load
+
+def write_fields(fields, n, peak=False):
+    """Write the fields of the load step n with the selected output format, the peak snapshot goes to its own files"""
+    for field in fields:
+        if output_format == 'xdmf':
+            (file_peak if peak else file_results).write(field, float(n))
+        else:
+            (file_pvd_peak if peak else file_pvd)[field.name()] << (field, n)
+
+# Parameters of the force displacement log
+force_log_flush = 1                   # steps between two flushes of the log to the file, 0 to flush only at the end of the run
+force_log_fsync = False               # True to also force the flushed rows to disk with os.fsync
+
+class ForceLog:
+    """Append-only log with one row per load step, readable with np.loadtxt while the run is going"""
+
+    def __init__(self, filename, columns):
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        self.file = open(filename, 'w')
+        self.file.write('# ' + ' '.join(columns) + '\n')
+        self.rows = 0
+        self.t_start = time.time()
+
+    def write(self, row):
+        """Append a row, the wall time since the start of the log is added as last column"""
+        self.file.write(' '.join('%.10e' %x for x in row) + ' %.3f\n' %(time.time() - self.t_start))
+        self.rows += 1
+        if force_log_flush > 0 and self.rows % force_log_flush == 0:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        if force_log_fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+# the first two columns are the former forces.txt
+force_log = ForceLog(savedir+'/forces.txt', ['displacement', 'force', 'step', 'staggered_iterations', 'alpha_max', 'elastic_energy', 'dissipated_energy', 'wall_time'])
+force_log.write([0., 0., 0, 0, 0., 0., 0.])
 
 # initialization of vectors to store force and displacement
 forces = np.zeros((num_steps+1, 2))
 
+def load_displacement():
+    """Applied displacement and reaction force"""
+    return np.array([u(200),assemble(sigma(u,alpha)[0]*ds(1))])
+
 # function for postprocessing 
+# Parameters of the output scheduler of the fields, the force log is written at every step
+output_every = 1                      # steps between two outputs of the fields, 0 to disable
+output_dalpha = 0.                    # change of the phase field (max norm) since the last output that triggers an output, 0 to disable
+output_peak = False                   # True to write the fields at the peak load
+output_peak_drop = 0.01               # relative drop of the load that confirms a peak
+output_displacements = []             # applied displacements at which the fields are written
+output_state = {'alpha': Function(V_alpha), 'disp': 0., 'peak': 0., 'peak_step': -1, 'peak_written': True}
+u_peak, alpha_peak = Function(V_u), Function(V_alpha)        # fields at the largest load so far
+u_peak.rename('displacement','displacement')
+alpha_peak.rename('damage','damage')
+
+def write_snapshot(u_out, alpha_out, n, peak=False):
+    """Write the fields of the load step n with the selected output format"""
+    write_fields([alpha_out, u_out], n, peak)
+
+# Parameters of the background writer of the fields
+output_async = False                  # True to save the fields from a writer process forked from the solver and to write the output files at the end of the run (serial runs only)
+output_queue_size = 2                 # snapshots waiting to be saved, the solver waits when the queue is full
+output_timeout = 10.                  # seconds between two checks of the writer process while the solver waits
+snapshot_dir = savedir+"/snapshots"   # dof values of the fields saved by the writer process, removed once the output files are written
+
+class FieldWriter:
+    """Writer process forked from the solver, it saves the dof values received through a bounded queue as numpy arrays.
+    The child makes no MPI, PETSc or HDF5 call, the output files are written from the arrays by the solver process in close"""
+
+    def __init__(self, maxsize):
+        context = multiprocessing.get_context('fork')
+        self.queue = context.Queue(maxsize=maxsize)
+        self.errors = context.Queue()
+        self.snapshots = []                                  # (file, step, peak) of the snapshots sent to the writer
+        if not os.path.isdir(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        self.process = context.Process(target=self.run, daemon=True)
+        self.process.start()
+
+    def run(self):
+        """Loop of the writer process, numpy only"""
+        failed = False
+        for (file_name, u_values, alpha_values) in iter(self.queue.get, None):     # the queue is drained until the end, also after an error
+            if failed:
+                continue
+            try:
+                np.savez(file_name, u=u_values, alpha=alpha_values)
+            except Exception as e:
+                failed = True
+                self.errors.put(repr(e))
+
+    def check(self):
+        """Raise the error of the writer process in the solver process"""
+        if not self.errors.empty():
+            raise RuntimeError("The field writer failed: %s" %self.errors.get())
+
+    def send(self, item):
+        """Put the item in the queue, the writer process is checked while the queue is full"""
+        while True:
+            self.check()
+            if not self.process.is_alive():
+                raise RuntimeError("The field writer process has stopped")
+            try:
+                self.queue.put(item, timeout=output_timeout)
+                return
+            except queue.Full:
+                pass
+
+    def put(self, u_out, alpha_out, n, peak):
+        """Send the dof values of the fields, waits while the queue is full"""
+        file_name = "%s/step_%d%s.npz" %(snapshot_dir, n, '_peak' if peak else '')
+        self.send((file_name, u_out.vector().get_local(), alpha_out.vector().get_local()))
+        self.snapshots.append((file_name, n, peak))
+
+    def close(self):
+        """Save the pending snapshots, stop the writer process and write the output files from the saved arrays"""
+        if self.process.is_alive():
+            self.send(None)
+            self.process.join()
+        self.check()
+        u_w, alpha_w = Function(V_u), Function(V_alpha)
+        u_w.rename('displacement','displacement')
+        alpha_w.rename('damage','damage')
+        for (file_name, n, peak) in self.snapshots:
+            data = np.load(file_name)
+            u_w.vector().set_local(data['u'])
+            u_w.vector().apply('insert')
+            alpha_w.vector().set_local(data['alpha'])
+            alpha_w.vector().apply('insert')
+            write_snapshot(u_w, alpha_w, n, peak)
+        shutil.rmtree(snapshot_dir)
+
+# the parallel runs write in the solver process, a fork is not safe next to the other MPI processes
+field_writer = FieldWriter(output_queue_size) if output_async and MPI.size(mesh.mpi_comm()) == 1 else None
+
+def dump_fields(u_out, alpha_out, n, peak=False):
+    """Write the fields of the load step n, or send them to the writer process"""
+    t_start = time.time()
+    if field_writer is not None:
+        field_writer.put(u_out, alpha_out, n, peak)
+    else:
+        write_snapshot(u_out, alpha_out, n, peak)
+    solver_stats['field_outputs'] += 1
+    solver_stats['output_time'] += time.time() - t_start
+
+def close_output():
+    """Flush the pending writes and close the output files, also at the exit on errors"""
+    if output_state.get('closed'):
+        return
+    output_state['closed'] = True
+    try:
+        if field_writer is not None:
+            field_writer.close()
+    finally:
+        force_log.close()
+        if output_format == 'xdmf':
+            file_results.close()
+            file_peak.close()
+
+atexit.register(close_output)
+
+def output_fields(n):
+    """Write the fields of the load step n when asked by the output scheduler"""
+    force, disp = abs(forces[n+1,1]), abs(forces[n+1,0])
+    if output_peak:
+        if force > output_state['peak']:
+            output_state.update({'peak': force, 'peak_step': n, 'peak_written': False})     # candidate peak, kept until the load drops
+            u_peak.assign(u)
+            alpha_peak.assign(alpha)
+        elif not output_state['peak_written'] and force < (1. - output_peak_drop)*output_state['peak']:
+            dump_fields(u_peak, alpha_peak, output_state['peak_step'], peak=True)
+            output_state['peak_written'] = True
+    write = output_every > 0 and n % output_every == 0
+    if not write and output_dalpha > 0.:
+        write = (alpha.vector() - output_state['alpha'].vector()).norm('linf') > output_dalpha
+    if not write:
+        write = any(output_state['disp'] < level <= disp for level in output_displacements)
+    output_state['disp'] = disp
+    if write:
+        dump_fields(u, alpha, n)
+        output_state['alpha'].assign(alpha)
+
 def postprocessing():
-    forces[n+1] = np.array([u(200),assemble(sigma(u,alpha)[0]*ds(1))])
+    forces[n+1] = load_displacement()
     # Dump solution to file
-    file_alpha << (alpha,n)                            # Phase field
-    file_u << (u,n)                                    # Displacement field
-    np.savetxt(savedir+'/forces.txt', forces)          # record force displacement data
-
+    output_fields(n)                                   # Phase field and displacement field
+    force_log.write(np.concatenate((forces[n+1], [n+1, iterations, alpha.vector().max(), assemble(elastic_energy), assemble(dissipated_energy)])))    # record force displacement data
+
+
+# Parameters of the predictor at the start of each load step
+predictor = 'none'                    # 'none' to start from the last converged state, 'extrapolation' or 'tangent' (last Jacobian)
+predictor_order = 2                   # number of converged steps of the extrapolation (2 linear, 3 quadratic)
+predictor_alpha = False               # True to extrapolate also the phase field, clipped to [lb, ub]
+predictor_hist = []                   # applied displacement, u and alpha of the last converged steps
+u_pred = Function(V_u)                # predicted displacement, to measure the savings
+
+def applied_displacement():
+    """Current value of the applied displacement"""
+    return u_R(0.)
+
+def lagrange_weights(t_hist, t):
+    """Weights of the Lagrange extrapolation to t from the values at t_hist"""
+    return [np.prod([(t - t_j)/(t_i - t_j) for j, t_j in enumerate(t_hist) if j != i]) for i, t_i in enumerate(t_hist)]
+
+def tangent_predictor():
+    """Displacement predictor with the factorisation of the last Jacobian, one back substitution"""
+    for bc_i in bc_disp:
+        bc_i.apply(u.vector())                                         # new boundary values
+    b_pred, du_pred = PETScVector(), u.vector().copy()
+    problem_u.F(b_pred, u.vector())
+    solver_u.linear_solver().solve(du_pred, b_pred)
+    u.vector().axpy(-1.0, du_pred)
+
+def predict_state():
+    """Predictor of (u, alpha) for the current load step from the last converged steps"""
+    if predictor != 'none' and predictor_hist:
+        hist = predictor_hist[-predictor_order:]
+        weights = lagrange_weights([h[0] for h in hist], applied_displacement())
+        if predictor == 'tangent' and u_problem_type == 'nonlinear' and solver_stats['factorization_u'] > 0:
+            tangent_predictor()
+        else:
+            u.vector()[:] = sum(l_i*h[1] for l_i, h in zip(weights, hist))
+        if predictor_alpha:
+            alpha.vector()[:] = np.clip(sum(l_i*h[2] for l_i, h in zip(weights, hist)), lb.vector().get_local(), ub.vector().get_local())
+    u_pred.assign(u)
+
+def store_converged_state(iterations):
+    """Store the converged step for the predictor and the statistics of the savings"""
+    if predictor_hist and load_control != 'dissipation':            # the path following does not use the predictor
+        dist_prev = np.linalg.norm(u.vector().get_local() - predictor_hist[-1][1])           # start from the last converged step
+        dist_pred = (u.vector() - u_pred.vector()).norm('l2')                                # start from the predictor
+        if dist_prev > 0.:
+            solver_stats['predictor_gain'] += dist_pred/dist_prev
+    predictor_hist.append((applied_displacement(), u.vector().get_local(), alpha.vector().get_local()))
+    del predictor_hist[:-3]
+    solver_stats['steps'] += 1
+    solver_stats['staggered'] += iterations
+
+# Parameters of the elastic stage before the onset of damage
+elastic_shortcut = False              # True to scale a single undamaged elastic solution until damage can start
+elastic_onset_margin = 0.98           # fraction of the onset load (squared) up to which the elastic solution is scaled
+elastic_state = {'active': True, 't_1': None, 'u_1': None, 'ratio': None}
+
+def elastic_step():
+    """Scaled elastic solution if no node can damage at the current load, False from the onset of damage on"""
+    t = applied_displacement()
+    if elastic_state['t_1'] is None:
+        if u_problem_type == 'linear':                                 # elastic solution at the first load step, alpha = lb = 0
+            solve_displacement_linear()
+        else:
+            solve_displacement()
+        g_el = assemble(derivative(elastic_energy, alpha, beta)).get_local()      # scales with the square of the load
+        g_d = assemble(derivative(dissipated_energy, alpha, beta)).get_local()    # independent of the load
+        drive = np.logical_and(g_el < 0., ub.vector().get_local() > lb.vector().get_local())
+        elastic_state['t_1'], elastic_state['u_1'] = t, u.vector().get_local()
+        elastic_state['ratio'] = np.min(g_d[drive]/(-g_el[drive])) if np.any(drive) else np.inf    # (t/t_1)**2 at the onset
+        print("Onset of damage at an applied displacement of %g" %(t*np.sqrt(elastic_state['ratio'])))
+    s = t/elastic_state['t_1']
+    if s <= 0. or s*s >= elastic_onset_margin*elastic_state['ratio']:
+        elastic_state['active'] = False
+        return False
+    u.vector()[:] = s*elastic_state['u_1']                             # the elastic energy is homogeneous of degree 2 in u
+    solver_stats['elastic_steps'] += 1
+    return True
+
+# Parameters of the adaptive load step controller, the increments are multiples of the base increment disp_step
+dt_init = 1.                          # initial increment
+dt_min, dt_max = 0.25, 50.            # bounds of the increment
+step_grow, step_shrink = 1.5, 0.5     # growth and reduction factors of the increment
+target_iter = {'staggered': 10, 'monolithic': 8}       # staggered or Newton iterations above which the increment is reduced
+max_iter_step = {'staggered': 50, 'monolithic': 25}     # staggered or Newton iterations above which the load step is rejected
+max_dalpha = 0.2                      # maximum increment of alpha_max in a load step
+max_force_drop = 0.05                 # maximum force drop in a load step, relative to the peak force
+
+def load_step_control(iterations, dalpha, force_drop, dt):
+    """Acceptance of the load step and increment of the next one"""
+    if dt > dt_min and (iterations > max_iter_step[solver_scheme] or dalpha > max_dalpha or force_drop > max_force_drop):
+        return (False, max(dt_min, step_shrink*dt))                   # reject and roll back
+    if iterations > target_iter[solver_scheme] or dalpha > 0.5*max_dalpha or force_drop > 0.5*max_force_drop:
+        return (True, max(dt_min, step_shrink*dt))
+    if iterations <= target_iter[solver_scheme]/2 and dalpha < 0.1*max_dalpha and force_drop <= 0.:
+        return (True, min(dt_max, step_grow*dt))                      # elastic response
+    return (True, dt)
 
 # Execution of the loading steps
-for n in range(num_steps):
-    u_R.n = n                                                       # Update loading according to the load step
+if load_control == 'adaptive':
+    u_R.disp_app = disp_step
+    t, t_end, dt = 0., num_steps, dt_init          # pseudo time in units of the base increment
+    u_conv, alpha_conv = Function(V_u), Function(V_alpha)           # last converged state to roll back rejected steps
+    lambda_conv = Function(V_alpha)                                 # multiplier of the augmented Lagrangian at the start of the step
+n = 0
+while n < num_steps:                                                # num_steps also bounds the adaptive load steps
+    if load_control == 'adaptive':
+        if t >= t_end - 1.e-8:
+            break
+        dt = min(dt, t_end - t)
+        u_R.n = t + dt - 1.
+        u_conv.assign(u)
+        alpha_conv.assign(alpha)
+        if irreversibility == 'augmented_lagrangian':
+            lambda_conv.assign(lambda_ir)
+    else:
+        u_R.n = 0 if load_control == 'dissipation' else n           # Update loading according to the load step
+    if load_control != 'dissipation':
+        predict_state()                                             # start of the load step
     # solve alternate minimization
-    alternate_minimization(u,alpha,maxiter=1000)                    # call solver function
+    maxiter = max_iter_step[solver_scheme] + 2 if load_control == 'adaptive' and dt > dt_min else None
+    if elastic_shortcut and elastic_state['active'] and load_control != 'dissipation' and elastic_step():
+        iterations = 0                                              # undamaged elastic step
+    elif solver_scheme == 'monolithic':
+        (converged, iterations) = monolithic_minimization(u,alpha,maxiter=maxiter or 500)    # call coupled solver function
+        if not converged:
+            if load_control != 'adaptive' or dt <= dt_min:
+                raise RuntimeError("The monolithic solver did not converge in load step %d" %n)
+            iterations = max_iter_step[solver_scheme] + 1           # rejected by the load step controller
+    else:
+        iterations = alternate_minimization(u,alpha,maxiter=maxiter or 1000)[1] - 1     # call solver function
+    if load_control == 'adaptive':
+        force_prev, force_peak = forces[n, 1], np.max(forces[:n+1, 1])
+        force_drop = (force_prev - load_displacement()[1])/force_peak if force_peak > 0. else 0.
+        (accepted, dt_next) = load_step_control(iterations, alpha.vector().max() - alpha_conv.vector().max(), force_drop, dt)
+        if not accepted:
+            u.assign(u_conv)
+            alpha.assign(alpha_conv)
+            if irreversibility == 'augmented_lagrangian':
+                lambda_ir.assign(lambda_conv)
+            print("Load step rejected, increment reduced to %g" %(dt_next*disp_step))
+            dt = dt_next
+            continue
+        t, dt = t + dt, dt_next
+    if load_control == 'dissipation':
+        path_state['lam'] = u_R.disp_app
+    store_converged_state(iterations)
     postprocessing()                                                # call postprocessing function
-    print("\nEnd of timestep %d with load %g"%(n, disp_app*(n+1)))  # print completion of load step in terminal
+    print("\nEnd of timestep %d with load %g"%(n, u_R(0.)))          # print completion of load step in terminal
     print("-----------------------------------------")
+    if irreversibility in ['penalty', 'augmented_lagrangian']:
+        alpha.vector()[:] = np.maximum(alpha.vector().get_local(), lb.vector().get_local())    # remove the admissible violation
     lb.vector()[:] = alpha.vector()                                 # updating the lower bound to account for the irreversibility
-
+    if irreversibility == 'history':
+        H_conv.assign(H)                                            # updating the history field
+    if irreversibility == 'augmented_lagrangian':
+        lambda_ir.vector().zero()                                   # new multiplier for the new lower bound
+    n = n + 1
+    if load_control == 'dissipation' and forces[n, 1] < path_end_stiffness*forces[1, 1]/forces[1, 0]*forces[n, 0]:
+        path_state['broken'] = True
+        break                                                       # the bar is broken
+if load_control == 'dissipation' and not path_state['broken']:
+    print("The bar is not broken after path_max_steps = %d load steps" %path_max_steps)
+
+close_output()
+print_solver_stats()